@@ -11,16 +11,28 @@
 # - National admin boundaries (PL + custom URL loader)
 
 import io
+import os
+import sys
 import time
 import math
 import json
+import pickle
+import hashlib
+import functools
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Tuple, Dict, Any, List, Optional
-from datetime import datetime
+from datetime import date, datetime
 
 import numpy as np
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import streamlit as st
+import streamlit.components.v1 as components
+import xlsxwriter  # type: ignore
 
 # ---------------------- Optional imports ----------------------
 try:
@@ -29,21 +41,75 @@ except Exception:
     from typing import Any as UploadedFile  # type: ignore
 
 try:
-    from streamlit_folium import st_folium  # type: ignore
     import folium  # type: ignore
-    from folium.plugins import Fullscreen  # type: ignore
+    from folium.plugins import Fullscreen, FastMarkerCluster  # type: ignore
     _HAS_MAP = True
 except Exception:
     _HAS_MAP = False
 
 # Geometry stack (required for admin/NUTS)
 try:
+    import shapely  # type: ignore
     from shapely.geometry import shape, Point  # type: ignore
     from shapely.strtree import STRtree  # type: ignore
     from shapely.validation import make_valid
     _HAS_SHAPELY = True
+    # Shapely 2 STRtree.query returns integer indices and accepts predicates
+    _SHAPELY_2 = int(shapely.__version__.split(".")[0]) >= 2
 except Exception:
     _HAS_SHAPELY = False
+    _SHAPELY_2 = False
+
+# Fast JSON decoding for large API/GeoJSON payloads (stdlib fallback)
+try:
+    import orjson  # type: ignore
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+except Exception:
+    _json_loads = json.loads
+    _json_dumps = json.dumps
+
+# H3 cells for coalescing nearby highway searches
+try:
+    import h3  # type: ignore
+    _HAS_H3 = True
+except Exception:
+    _HAS_H3 = False
+
+# Rust-backed xlsx writer (xlsxwriter fallback)
+try:
+    from rustpy_xlsxwriter import FastExcel  # type: ignore
+    _HAS_FAST_EXCEL = True
+except Exception:
+    _HAS_FAST_EXCEL = False
+
+# JIT for the nearest-point distance scan (pure NumPy fallback)
+try:
+    from numba import njit  # type: ignore
+    _HAS_NUMBA = True
+except Exception:
+    _HAS_NUMBA = False
+
+# Rust-backed xlsx reader for uploads (openpyxl fallback)
+try:
+    import python_calamine  # type: ignore  # noqa: F401
+    _HAS_CALAMINE = True
+except Exception:
+    _HAS_CALAMINE = False
+
+# Haversine BallTree for top-N facility queries on large tables (linear scan fallback)
+try:
+    from sklearn.neighbors import BallTree  # type: ignore
+    _HAS_SKLEARN = True
+except Exception:
+    _HAS_SKLEARN = False
+
+# Parquet snapshots of results kept in session_state (raw DataFrame fallback)
+try:
+    import pyarrow  # type: ignore  # noqa: F401
+    _HAS_PARQUET = True
+except Exception:
+    _HAS_PARQUET = False
 
 # ---------------------- App constants ----------------------
 APP_TITLE = "Road Distance Finder v2.0"
@@ -52,6 +118,14 @@ DEFAULT_REF = {"name": "Bedburg, Germany", "lat": 51.0126, "lon": 6.5741}
 REQUIRED_SITES_COLS = ["Project ID", "Site ID", "Site Name", "Latitude", "Longitude"]
 REQUIRED_AIRPORTS_COLS = ["Airport Name", "Latitude", "Longitude"]
 REQUIRED_SEAPORTS_COLS = ["Seaport Name", "Latitude", "Longitude"]
+FACILITY_TREE_MIN_POINTS = 1000  # below this a linear haversine scan per site is faster
+MAP_CLUSTER_MIN_SITES = 100  # from here on sites go into one FastMarkerCluster layer
+SITE_POPUP_TEMPLATE = ("<b>{Site Name}</b><br>"
+                       "Project: {Project ID}<br>"
+                       "Site ID: {Site ID}<br>"
+                       "Airport: {Distance to Airport (km)} km<br>"
+                       "Seaport: {Distance to Seaport (km)} km<br>"
+                       "Highway: {Distance to Highway (km)} km")
 ENRICH_DEFAULT_OSM_ADMIN = True
 
 # Eurostat API endpoints
@@ -68,50 +142,350 @@ ACTIVE_POP_DATASET = "lfst_r_lfp3pop"  # Active population by NUTS 3 regions
 NUTS2_URL = "https://gisco-services.ec.europa.eu/distribution/v2/nuts/geojson/NUTS_RG_01M_2021_4326_LEVL_2.geojson"
 NUTS3_URL = "https://gisco-services.ec.europa.eu/distribution/v2/nuts/geojson/NUTS_RG_01M_2021_4326_LEVL_3.geojson"
 
+# On-disk cache for parsed NUTS/admin geometries (survives process restarts)
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "roaddistance")
+NUTS_CACHE_TTL_S = 30 * 86400
+ADMIN_CACHE_TTL_S = 30 * 86400
+API_CACHE_PATH = os.path.join(CACHE_DIR, "api_cache.sqlite")
+API_CACHE_TTL_S = 90 * 86400
+
 # Overpass API for highway detection
 OVERPASS_URL = "https://overpass-api.de/api/interpreter"
+HIGHWAY_H3_RES = 7  # ~5 km cells; sites in one cell share an Overpass response
+HIGHWAY_H3_PAD_KM = 1.5  # search padding, above the ~1.2 km circumradius of a res-7 cell
+HIGHWAY_BATCH_SITES = 5  # search points per union Overpass query in batch highway lookups
+HIGHWAY_BATCH_SPAN_KM = 100  # max distance of a batched search point from the batch's first one
+# Highway access strategies, most specific first: (element filter, recurse into way nodes)
+OVERPASS_HIGHWAY_STRATEGIES = [
+    ('node["highway"="motorway_junction"]', False),  # motorway junctions
+    ('way["highway"~"motorway_link|trunk_link|motorway|trunk"]', True),  # motorway and trunk links
+    ('way["highway"~"primary|secondary"]', True),  # primary roads (major roads)
+    ('node["highway"~"motorway|trunk|primary"]', False),  # any highway access
+]
+OVERPASS_TIMEOUT_S = 90  # server-side limit for one union query; the HTTP timeout adds transfer slack
+OVERPASS_UNION_TMPL = "[out:json][timeout:%d];\n(\n{clauses}\n);\n{recurse}out body;" % OVERPASS_TIMEOUT_S
 
 # OSM endpoints
 NOMINATIM_REVERSE = "https://nominatim.openstreetmap.org/reverse"
 NOMINATIM_SEARCH = "https://nominatim.openstreetmap.org/search"
+OSM_REVERSE_DECIMALS = 3  # ~100 m; sites in the same cell share one reverse lookup
+OSM_REVERSE_WORKERS = 4  # cache hits resolve in parallel; Nominatim itself stays 1 req/s
 
 # OSRM routing
 OSRM_URL = "https://router.project-osrm.org/route/v1/driving/{lon1},{lat1};{lon2},{lat2}?overview=false&annotations=duration,distance"
+OSRM_TABLE_URL = "https://router.project-osrm.org/table/v1/driving/{coords}?sources={sources}&destinations={destinations}&annotations=distance,duration"
+OSRM_TABLE_MAX_COORDS = 100  # coordinates per /table request (demo server limit)
+OSRM_MAX_WORKERS = 8  # concurrent route requests
+ROUTE_KEY_DECIMALS = 4  # ~11 m; near-identical route requests share one disk cache entry
 
-# ---------------------- Load EU Cities Database ----------------------
-import os
-import sys
+# HTTP
+HTTP_POOL_SIZE = 32
+NOMINATIM_HEADERS = {"User-Agent": "RoadDistanceFinder/2.0"}
+NOMINATIM_MIN_INTERVAL_S = 1.0  # Nominatim usage policy: max 1 request/second
 
+# ---------------------- Load EU Cities Database ----------------------
 # Ensure we can find eu_cities_db.py in the same directory
 _app_dir = os.path.dirname(os.path.abspath(__file__))
 if _app_dir not in sys.path:
     sys.path.insert(0, _app_dir)
 
 try:
-    from eu_cities_db import EU_CITIES_DB, get_nearest_city
+    from eu_cities_db import EU_CITIES_DB, get_nearest_city, get_nearest_cities_bulk
     _HAS_CITIES_DB = True
 except ImportError as import_err:
     _HAS_CITIES_DB = False
     EU_CITIES_DB = {}
     def get_nearest_city(lat, lon, max_distance=200):
         return None
+    def get_nearest_cities_bulk(lats, lons, max_distance=200):
+        return [None] * len(lats)
 
 # ---------------------- Utilities ----------------------
 def haversine_km(lat1, lon1, lat2, lon2):
-    """Calculate distance between two points on Earth using Haversine formula"""
+    """Calculate distance between two points on Earth using Haversine formula.
+    
+    Arguments may be scalars or NumPy arrays (broadcast), so one site can be
+    measured against many destinations in a single call.
+    """
     R = 6371.0088
     phi1 = np.radians(lat1)
     phi2 = np.radians(lat2)
     dphi = np.radians(lat2 - lat1)
     dlambda = np.radians(lon2 - lon1)
     a = np.sin(dphi/2.0)**2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda/2.0)**2
-    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1-a))
+    c = 2 * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
     return R * c
 
+def _haversine_pre_loop(slat_rad, slon_rad, cos_slat, lat_rad, lon_rad, cos_lat, out):
+    """One fused pass per destination, no temporary arrays (compiled with Numba)"""
+    for i in range(lat_rad.shape[0]):
+        a = math.sin((lat_rad[i] - slat_rad)/2.0)**2 + cos_slat * cos_lat[i] * math.sin((lon_rad[i] - slon_rad)/2.0)**2
+        out[i] = 6371.0088 * 2 * math.asin(math.sqrt(min(a, 1.0)))
+
+if _HAS_NUMBA:
+    _haversine_pre_jit = njit(cache=True)(_haversine_pre_loop)
+
+def haversine_km_pre(slat_rad, slon_rad, cos_slat, lat_rad, lon_rad, cos_lat):
+    """Haversine distance in km from inputs already in radians, with their cosines precomputed"""
+    if _HAS_NUMBA and isinstance(lat_rad, np.ndarray) and lat_rad.ndim == 1:
+        out = np.empty(lat_rad.shape[0], dtype=np.float64)
+        _haversine_pre_jit(float(slat_rad), float(slon_rad), float(cos_slat), lat_rad, lon_rad, cos_lat, out)
+        return out
+    a = np.sin((lat_rad - slat_rad)/2.0)**2 + cos_slat * cos_lat * np.sin((lon_rad - slon_rad)/2.0)**2
+    return 6371.0088 * 2 * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def topn_idx(dists: np.ndarray, n: int) -> np.ndarray:
+    """Indices of the n smallest distances, nearest first, via a partial sort"""
+    k = min(n, len(dists))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if k < len(dists):
+        idxs = np.argpartition(dists, k - 1)[:k]
+    else:
+        idxs = np.arange(k)
+    return idxs[np.argsort(dists[idxs])]
+
+@st.cache_resource(show_spinner=False)
+def _facility_balltree(lat_rad: np.ndarray, lon_rad: np.ndarray) -> Any:
+    return BallTree(np.column_stack([lat_rad, lon_rad]), metric="haversine")
+
+def facility_topn_bulk(lat_rad: np.ndarray, lon_rad: np.ndarray, f_lat_rad: np.ndarray, f_lon_rad: np.ndarray,
+                       n: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """Indices and distances (km) of the n nearest facilities for every site, nearest first.
+    
+    Returns None when the table is small (or scikit-learn is missing) and a per-site scan is cheaper.
+    """
+    if not _HAS_SKLEARN or n <= 0 or len(f_lat_rad) < FACILITY_TREE_MIN_POINTS:
+        return None
+    tree = _facility_balltree(f_lat_rad, f_lon_rad)
+    dist, ind = tree.query(np.column_stack([lat_rad, lon_rad]), k=min(n, len(f_lat_rad)))
+    return ind, dist * 6371.0088
+
+def _nearest_haversine_loop(lat, lon, lats, lons):
+    """Fused haversine + argmin in one pass, without a temporary distance array"""
+    R = 6371.0088
+    phi1 = math.radians(lat)
+    cos_phi1 = math.cos(phi1)
+    min_i = -1
+    min_d = math.inf
+    for i in range(lats.size):
+        phi2 = math.radians(lats[i])
+        dphi = phi2 - phi1
+        dlambda = math.radians(lons[i] - lon)
+        a = math.sin(dphi/2.0)**2 + cos_phi1 * math.cos(phi2) * math.sin(dlambda/2.0)**2
+        d = 2 * R * math.asin(math.sqrt(min(a, 1.0)))
+        if d < min_d:
+            min_d = d
+            min_i = i
+    return min_i, min_d
+
+if _HAS_NUMBA:
+    _nearest_haversine_jit = njit(cache=True)(_nearest_haversine_loop)
+
+def nearest_haversine_idx(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> Tuple[int, float]:
+    """Index and distance (km) of the point in lats/lons closest to (lat, lon); (-1, inf) if none is finite"""
+    if _HAS_NUMBA:
+        i, d = _nearest_haversine_jit(float(lat), float(lon), lats, lons)
+        return int(i), float(d)
+    dists = haversine_km(lat, lon, lats, lons)
+    dists[np.isnan(dists)] = np.inf
+    i = int(dists.argmin())
+    if dists[i] == np.inf:
+        return -1, math.inf
+    return i, float(dists[i])
+
+# ---------------------- HTTP ----------------------
+@st.cache_resource(show_spinner=False)
+def _http_session() -> requests.Session:
+    """Shared keep-alive session with a connection pool sized for concurrent calls"""
+    s = requests.Session()
+    # Transient GET failures are retried with backoff; the last response is returned as-is
+    retry = Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504],
+                  raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    s.headers.update({"User-Agent": NOMINATIM_HEADERS["User-Agent"]})
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+@st.cache_resource(show_spinner=False)
+def _nominatim_throttle() -> Dict[str, Any]:
+    return {"lock": threading.Lock(), "last": 0.0}
+
+def _nominatim_get(url: str, params: Dict[str, Any]) -> requests.Response:
+    """GET against Nominatim, serialized and spaced per its 1 req/sec policy"""
+    throttle = _nominatim_throttle()
+    with throttle["lock"]:
+        wait = NOMINATIM_MIN_INTERVAL_S - (time.monotonic() - throttle["last"])
+        if wait > 0:
+            time.sleep(wait)
+        try:
+            return _http_session().get(url, params=params, headers=NOMINATIM_HEADERS, timeout=12)
+        finally:
+            throttle["last"] = time.monotonic()
+
+class RateLimiter:
+    """Thread-safe token bucket: up to `burst` calls back to back, refilled at `rate` calls/sec"""
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until a call is allowed"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens < 1:
+                time.sleep((1 - self.tokens) / self.rate)
+                self.last = time.monotonic()
+                self.tokens = 1.0
+            self.tokens -= 1
+
+# ---------------------- Persistent API cache ----------------------
+class DiskCache:
+    """Thread-safe SQLite key/value store for JSON-serializable API results"""
+    def __init__(self, path: str, ttl_s: float = API_CACHE_TTL_S):
+        self.ttl_s = ttl_s
+        self.lock = threading.Lock()
+        self.conn = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.execute("CREATE TABLE IF NOT EXISTS kv (k TEXT PRIMARY KEY, v TEXT, ts REAL)")
+            self.conn.commit()
+        except Exception:
+            self.conn = None
+
+    def get(self, key: str) -> Any:
+        if self.conn is None:
+            return None
+        try:
+            with self.lock:
+                row = self.conn.execute("SELECT v, ts FROM kv WHERE k = ?", (key,)).fetchone()
+            if row is None or time.time() - row[1] > self.ttl_s:
+                return None
+            try:
+                return _json_loads(row[0])
+            except ValueError:
+                return json.loads(row[0])  # NaN/Infinity literals written by json.dumps
+        except Exception:
+            return None
+
+    def set(self, key: str, value: Any) -> None:
+        if self.conn is None:
+            return
+        try:
+            with self.lock:
+                self.conn.execute("INSERT OR REPLACE INTO kv (k, v, ts) VALUES (?, ?, ?)",
+                                  (key, json.dumps(value), time.time()))
+                self.conn.commit()
+        except Exception:
+            pass
+
+@st.cache_resource(show_spinner=False)
+def _disk_cache() -> DiskCache:
+    return DiskCache(API_CACHE_PATH)
+
+def _coord_key(*coords: float, decimals: int = 5) -> str:
+    """Cache key fragment with coordinates rounded to 5 decimals (~1 m) by default"""
+    return ",".join(f"{c:.{decimals}f}" for c in coords)
+
+# ---------------------- Excel writing ----------------------
+def _df_to_xlsx_bytes(df: pd.DataFrame, sheet_name: str) -> bytes:
+    """Serialize a DataFrame to a single-sheet xlsx file"""
+    b = io.BytesIO()
+    if _HAS_FAST_EXCEL:
+        try:
+            FastExcel(b).sheet(sheet_name, df).save()
+            return b.getvalue()
+        except Exception:
+            b = io.BytesIO()
+    # Write-only xlsxwriter path: rows are streamed to the sheet instead of
+    # going through pandas' ExcelFormatter cell objects
+    wb = xlsxwriter.Workbook(b, {"constant_memory": True, "in_memory": True})
+    ws = wb.add_worksheet(sheet_name)
+    header_fmt = wb.add_format({"bold": True, "border": 1, "align": "center", "valign": "top"})
+    # Same number formats pandas' ExcelWriter applies to datetimes and dates
+    datetime_fmt = wb.add_format({"num_format": "YYYY-MM-DD HH:MM:SS"})
+    date_fmt = wb.add_format({"num_format": "YYYY-MM-DD"})
+    ws.write_row(0, 0, [str(c) for c in df.columns], header_fmt)
+    
+    def _write_datetime(r, j, v):
+        ws.write_datetime(r, j, v, datetime_fmt)
+    
+    def _write_obj(r, j, v):
+        if type(v) is str:
+            ws.write_string(r, j, v)
+        elif isinstance(v, datetime):
+            ws.write_datetime(r, j, v, datetime_fmt)
+        elif isinstance(v, date):
+            ws.write_datetime(r, j, v, date_fmt)
+        else:
+            ws.write(r, j, v)
+    
+    # Per-column writer picked once from the dtype; None cells stay blank
+    cols, writers = [], []
+    for c in df.columns:
+        s = df[c]
+        kind = s.dtype.kind if isinstance(s.dtype, np.dtype) else "O"
+        if kind == "f":
+            arr = s.to_numpy()
+            finite = np.isfinite(arr)  # NaN/inf in one vectorized pass
+            cols.append([v if ok else None for v, ok in zip(arr.tolist(), finite.tolist())])
+            writers.append(ws.write_number)
+        elif kind in "iu":
+            cols.append(s.to_numpy().tolist())
+            writers.append(ws.write_number)
+        elif kind == "b":
+            cols.append(s.to_numpy().tolist())
+            writers.append(ws.write_boolean)
+        elif kind == "M":
+            cols.append([v if ok else None for v, ok in zip(s.dt.to_pydatetime().tolist(), s.notna().tolist())])
+            writers.append(_write_datetime)
+        else:
+            s = s.astype(object)
+            cols.append(s.where(s.notna(), None).tolist())
+            writers.append(_write_obj)
+    for r, row in enumerate(zip(*cols), start=1):
+        for j, v in enumerate(row):
+            if v is not None:
+                writers[j](r, j, v)
+    wb.close()
+    return b.getvalue()
+
+# ---------------------- Session snapshots ----------------------
+@st.cache_data(show_spinner=False, max_entries=4)
+def _df_from_parquet(data: bytes) -> pd.DataFrame:
+    return pd.read_parquet(io.BytesIO(data))
+
+def _stash_frame(key: str, df: Optional[pd.DataFrame]):
+    """Keep a DataFrame in session_state as zstd Parquet bytes when possible"""
+    st.session_state.pop(key, None)
+    st.session_state.pop(key + "_parquet", None)
+    if _HAS_PARQUET and df is not None:
+        try:
+            buf = io.BytesIO()
+            df.to_parquet(buf, compression="zstd")
+            st.session_state[key + "_parquet"] = buf.getvalue()
+            return
+        except Exception:
+            pass  # mixed-type object columns etc. - keep the frame itself
+    st.session_state[key] = df
+
+def _load_frame(key: str) -> Optional[pd.DataFrame]:
+    data = st.session_state.get(key + "_parquet")
+    if data is not None:
+        return _df_from_parquet(data)
+    return st.session_state.get(key)
+
 # ---------------------- Template files ----------------------
-@st.cache_data(show_spinner=False)
+@st.cache_resource(show_spinner=False)
 def template_files() -> Dict[str, bytes]:
-    """Generate Excel templates with example data"""
+    """Generate Excel templates with example data (once per process; treat as read-only)"""
     out: Dict[str, bytes] = {}
     
     # Sites.xlsx with Project ID and Site ID
@@ -123,10 +497,7 @@ def template_files() -> Dict[str, bytes]:
         {"Project ID": "P-20250101-02", "Site ID": "SK-20250102-01", "Site Name": "Example Plant C", 
          "Latitude": 50.1109, "Longitude": 8.6821},
     ])
-    b = io.BytesIO()
-    with pd.ExcelWriter(b, engine="xlsxwriter") as xw:
-        df_sites.to_excel(xw, sheet_name="Sites", index=False)
-    out["Sites.xlsx"] = b.getvalue()
+    out["Sites.xlsx"] = _df_to_xlsx_bytes(df_sites, "Sites")
     
     # Airports.xlsx
     df_airports = pd.DataFrame([
@@ -136,10 +507,7 @@ def template_files() -> Dict[str, bytes]:
         {"Airport Name": "Prague Vaclav Havel", "IATA": "PRG", "Latitude": 50.1008, "Longitude": 14.2600},
         {"Airport Name": "Amsterdam Schiphol", "IATA": "AMS", "Latitude": 52.3105, "Longitude": 4.7683},
     ])
-    b = io.BytesIO()
-    with pd.ExcelWriter(b, engine="xlsxwriter") as xw:
-        df_airports.to_excel(xw, sheet_name="Airports", index=False)
-    out["Airports.xlsx"] = b.getvalue()
+    out["Airports.xlsx"] = _df_to_xlsx_bytes(df_airports, "Airports")
     
     # Seaports.xlsx
     df_ports = pd.DataFrame([
@@ -149,119 +517,202 @@ def template_files() -> Dict[str, bytes]:
         {"Seaport Name": "Gdynia", "UNLOCODE": "PLGDY", "Latitude": 54.5333, "Longitude": 18.5500},
         {"Seaport Name": "Valencia", "UNLOCODE": "ESVLC", "Latitude": 39.4400, "Longitude": -0.3167},
     ])
-    b = io.BytesIO()
-    with pd.ExcelWriter(b, engine="xlsxwriter") as xw:
-        df_ports.to_excel(xw, sheet_name="Seaports", index=False)
-    out["Seaports.xlsx"] = b.getvalue()
+    out["Seaports.xlsx"] = _df_to_xlsx_bytes(df_ports, "Seaports")
     
     return out
 
 # ---------------------- Site Selection Tool Export Format ----------------------
+@st.cache_data(show_spinner=False, max_entries=4)
 def create_site_selection_format(df_results: pd.DataFrame, ref_name: str = None, catchment_radius: int = 50) -> pd.DataFrame:
     """Convert results to long format for Site Selection Tool"""
-    long_format_rows = []
-    
-    for _, row in df_results.iterrows():
-        # Extract base site information
-        project_id = row.get("Project ID", "")
-        site_id = row.get("Site ID", "")
-        site_name = row.get("Site Name", "")
-        lat = row.get("Latitude", "")
-        lon = row.get("Longitude", "")
-        nuts3_code = row.get("NUTS3 Code", "")
-        
-        # Airport record (Accessibility: 1)
-        if pd.notna(row.get("Nearest Airport")):
-            long_format_rows.append({
-                "Project ID": project_id,
-                "Project Name": "",
-                "Site ID": site_id,
-                "Site Name": site_name,
-                "LatitudeY": lat,
-                "LongitudeX": lon,
-                "Destination": row.get("Nearest Airport", ""),
-                "Destination group": "Nearest Airport",
-                "Distance (km)": row.get("Distance to Airport (km)", ""),
-                "Time (min)": row.get("Time to Airport (min)", ""),
-                "Accessibility": 1,
-                "NUTS3 Code": nuts3_code
-            })
-        
-        # Seaport record (renamed to "Inbound", Accessibility: 0)
-        if pd.notna(row.get("Nearest Seaport")):
-            long_format_rows.append({
-                "Project ID": project_id,
-                "Project Name": "",
-                "Site ID": site_id,
-                "Site Name": site_name,
-                "LatitudeY": lat,
-                "LongitudeX": lon,
-                "Destination": row.get("Nearest Seaport", ""),
-                "Destination group": "Inbound",
-                "Distance (km)": row.get("Distance to Seaport (km)", ""),
-                "Time (min)": row.get("Time to Seaport (min)", ""),
-                "Accessibility": 0,
-                "NUTS3 Code": nuts3_code
-            })
-        
-        # Highway record (Accessibility: 1)
-        if pd.notna(row.get("Nearest Highway Access")):
-            long_format_rows.append({
-                "Project ID": project_id,
-                "Project Name": "",
-                "Site ID": site_id,
-                "Site Name": site_name,
-                "LatitudeY": lat,
-                "LongitudeX": lon,
-                "Destination": row.get("Nearest Highway Access", ""),
-                "Destination group": "Nearest Highway",
-                "Distance (km)": row.get("Distance to Highway (km)", ""),
-                "Time (min)": row.get("Time to Highway (min)", ""),
-                "Accessibility": 1,
-                "NUTS3 Code": nuts3_code
-            })
-        
-        # Reference location (renamed to "Outbound", Accessibility: 0)
-        if ref_name:
-            ref_dist_col = f"Distance to {ref_name} (km)"
-            ref_time_col = f"Time to {ref_name} (min)"
-            if ref_dist_col in row and pd.notna(row[ref_dist_col]):
-                long_format_rows.append({
-                    "Project ID": project_id,
-                    "Project Name": "",
-                    "Site ID": site_id,
-                    "Site Name": site_name,
-                    "LatitudeY": lat,
-                    "LongitudeX": lon,
-                    "Destination": ref_name,
-                    "Destination group": "Outbound",
-                    "Distance (km)": row.get(ref_dist_col, ""),
-                    "Time (min)": row.get(ref_time_col, ""),
-                    "Accessibility": 0,
-                    "NUTS3 Code": nuts3_code
-                })
-        
-        # Nearest city (100k+) (Accessibility: 1)
-        if pd.notna(row.get("Nearest City (100k+)")):
-            long_format_rows.append({
-                "Project ID": project_id,
-                "Project Name": "",
-                "Site ID": site_id,
-                "Site Name": site_name,
-                "LatitudeY": lat,
-                "LongitudeX": lon,
-                "Destination": row.get("Nearest City (100k+)", ""),
-                "Destination group": "Nearest City",
-                "Distance (km)": row.get("Distance to City (km)", ""),
-                "Time (min)": row.get("Time to City (min)", ""),
-                "Accessibility": 1,
-                "NUTS3 Code": nuts3_code,
-                "City Population": row.get("City Population", "")
-            })
-    
-    return pd.DataFrame(long_format_rows)
+    # (destination column, destination group, distance column, time column, accessibility)
+    groups = [
+        ("Nearest Airport", "Nearest Airport", "Distance to Airport (km)", "Time to Airport (min)", 1),
+        ("Nearest Seaport", "Inbound", "Distance to Seaport (km)", "Time to Seaport (min)", 0),
+        ("Nearest Highway Access", "Nearest Highway", "Distance to Highway (km)", "Time to Highway (min)", 1),
+    ]
+    if ref_name:
+        # Reference location rows exist wherever the reference distance is known
+        groups.append((None, "Outbound", f"Distance to {ref_name} (km)", f"Time to {ref_name} (min)", 0))
+    groups.append(("Nearest City (100k+)", "Nearest City", "Distance to City (km)", "Time to City (min)", 1))
+    
+    def col(name: str) -> pd.Series:
+        if name in df_results.columns:
+            return df_results[name]
+        return pd.Series("", index=df_results.index)
+    
+    site_pos = np.arange(len(df_results))
+    parts = []
+    for order, (dest_col, group, dist_col, time_col, access) in enumerate(groups):
+        key_col = dist_col if dest_col is None else dest_col
+        if key_col not in df_results.columns:
+            continue
+        mask = df_results[key_col].notna()
+        if not mask.any():
+            continue
+        dest = pd.Series(ref_name, index=df_results.index) if dest_col is None else df_results[dest_col]
+        part = pd.DataFrame({
+            "Project ID": col("Project ID"),
+            "Project Name": "",
+            "Site ID": col("Site ID"),
+            "Site Name": col("Site Name"),
+            "LatitudeY": col("Latitude"),
+            "LongitudeX": col("Longitude"),
+            "Destination": dest,
+            "Destination group": group,
+            "Distance (km)": col(dist_col),
+            "Time (min)": col(time_col),
+            "Accessibility": access,
+            "NUTS3 Code": col("NUTS3 Code"),
+        })[mask]
+        if group == "Nearest City":
+            part["City Population"] = col("City Population")[mask]
+        part["_site"] = site_pos[mask.to_numpy()]
+        part["_group"] = order
+        parts.append(part)
+    
+    if not parts:
+        return pd.DataFrame()
+    
+    # Keep the per-site row order: all destinations of site 1, then site 2, ...
+    out = pd.concat(parts, ignore_index=True).sort_values(["_site", "_group"], kind="stable")
+    return out.drop(columns=["_site", "_group"]).reset_index(drop=True)
 
 # ---------------------- NUTS Loading (Fixed) ----------------------
+def _prepared_geom_array(geoms: List[Any]) -> np.ndarray:
+    """Object array of geometries, prepared in place for repeated predicate tests (Shapely 2)"""
+    arr = np.empty(len(geoms), dtype=object)
+    arr[:] = geoms
+    shapely.prepare(arr)
+    return arr
+
+def _make_tree_lookup(tree: Any, geoms: List[Any], geom_arr: Optional[np.ndarray] = None):
+    """Build a point -> matching geometry indices function for the installed Shapely.
+    
+    Bounding-box candidates from the tree are confirmed against prepared polygons.
+    """
+    if _SHAPELY_2:
+        if geom_arr is None:
+            geom_arr = _prepared_geom_array(geoms)
+        
+        def lookup(pt):
+            cand = tree.query(pt)
+            return cand[shapely.intersects(geom_arr[cand], pt)]
+        return lookup
+    # Shapely 1.x returns geometries, not indices: map them back by identity
+    from shapely.prepared import prep  # type: ignore
+    geom_to_idx = {id(g): i for i, g in enumerate(geoms)}
+    prepared = [prep(g) for g in geoms]
+    return lambda pt: [geom_to_idx[id(c)] for c in tree.query(pt)
+                       if id(c) in geom_to_idx and prepared[geom_to_idx[id(c)]].intersects(pt)]
+
+def _nuts_props(feat: Dict[str, Any]) -> Dict[str, Any]:
+    pr = feat.get("properties", {})
+    return {
+        "NUTS_ID": pr.get("NUTS_ID", ""),
+        "NAME_LATN": pr.get("NAME_LATN", ""),
+        "LEVL_CODE": pr.get("LEVL_CODE", ""),
+        "CNTR_CODE": pr.get("CNTR_CODE", ""),
+    }
+
+def _download_nuts_geoms(url: str) -> Tuple[List[Any], List[Dict[str, Any]], List[float], List[float]]:
+    """Download NUTS GeoJSON and parse it into geometries, props and centroids"""
+    # Download with retries
+    max_retries = 3
+    for attempt in range(max_retries):
+        try:
+            r = _http_session().get(url, timeout=120)
+            r.raise_for_status()
+            gj = _json_loads(r.content)
+            break
+        except requests.exceptions.Timeout:
+            if attempt == max_retries - 1:
+                raise
+            time.sleep(2 ** attempt)
+    
+    features = [f for f in gj.get("features", []) if f.get("geometry")]
+    
+    if _SHAPELY_2:
+        # Parse, repair and filter all geometries with vectorized Shapely ufuncs
+        raw = np.array([_json_dumps(f["geometry"]) for f in features], dtype=object)
+        geom_arr = shapely.from_geojson(raw, on_invalid="ignore")
+        invalid = shapely.is_geometry(geom_arr) & ~shapely.is_valid(geom_arr)
+        if invalid.any():
+            geom_arr[invalid] = shapely.make_valid(geom_arr[invalid])
+        keep = shapely.is_geometry(geom_arr) & ~shapely.is_empty(geom_arr)
+        geom_arr = geom_arr[keep]
+        cents = shapely.centroid(geom_arr)
+        geoms = geom_arr.tolist()
+        props = [_nuts_props(f) for f, k in zip(features, keep.tolist()) if k]
+        cent_lat = shapely.get_y(cents).tolist()
+        cent_lon = shapely.get_x(cents).tolist()
+        return geoms, props, cent_lat, cent_lon
+    
+    geoms = []
+    props = []
+    cent_lat = []
+    cent_lon = []
+    
+    for feat in features:
+        try:
+            g = shape(feat["geometry"])
+            
+            # Repair invalid geometries
+            if not g.is_valid:
+                try:
+                    g = make_valid(g)
+                except:
+                    g = g.buffer(0)
+            
+            if g.is_empty:
+                continue
+            
+            c = g.centroid
+            geoms.append(g)
+            props.append(_nuts_props(feat))
+            cent_lat.append(c.y)
+            cent_lon.append(c.x)
+        except Exception:
+            continue
+    
+    return geoms, props, cent_lat, cent_lon
+
+def _nuts_cache_path(url: str) -> str:
+    return os.path.join(CACHE_DIR, f"nuts_{hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]}.pkl")
+
+def _read_nuts_cache(url: str) -> Optional[Dict[str, Any]]:
+    """Restore geometries/props/centroids saved by _write_nuts_cache, if fresh"""
+    path = _nuts_cache_path(url)
+    try:
+        if time.time() - os.path.getmtime(path) > NUTS_CACHE_TTL_S:
+            return None
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+        data["geoms"] = list(shapely.from_wkb(data.pop("wkb")))
+        return data
+    except Exception:
+        return None
+
+def _write_nuts_cache(url: str, geoms: List[Any], props: List[Dict[str, Any]],
+                      cent_lat: List[float], cent_lon: List[float]) -> None:
+    path = _nuts_cache_path(url)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        geom_arr = np.empty(len(geoms), dtype=object)
+        geom_arr[:] = geoms
+        data = {
+            "wkb": shapely.to_wkb(geom_arr),
+            "props": props,
+            "cent_lat": cent_lat,
+            "cent_lon": cent_lon,
+        }
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except Exception:
+        pass
+
 @st.cache_resource(show_spinner=False)
 def _load_nuts_index(url: str) -> Dict[str, Any]:
     """Load NUTS geometries and build spatial index"""
@@ -269,58 +720,38 @@ def _load_nuts_index(url: str) -> Dict[str, Any]:
         return {"ok": False, "msg": "Shapely not installed", "tree": None, "geoms": [], "props": [], "count": 0}
     
     try:
-        # Download with retries
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                r = requests.get(url, timeout=120)
-                r.raise_for_status()
-                gj = r.json()
-                break
-            except requests.exceptions.Timeout:
-                if attempt == max_retries - 1:
-                    raise
-                time.sleep(2 ** attempt)
-        
-        geoms = []
-        props = []
-        
-        for feat in gj.get("features", []):
-            try:
-                geom_data = feat.get("geometry")
-                if not geom_data:
-                    continue
-                
-                g = shape(geom_data)
-                
-                # Repair invalid geometries
-                if not g.is_valid:
-                    try:
-                        g = make_valid(g)
-                    except:
-                        g = g.buffer(0)
-                
-                if g.is_empty:
-                    continue
-                
-                pr = feat.get("properties", {})
-                prop_dict = {
-                    "NUTS_ID": pr.get("NUTS_ID", ""),
-                    "NAME_LATN": pr.get("NAME_LATN", ""),
-                    "LEVL_CODE": pr.get("LEVL_CODE", ""),
-                    "CNTR_CODE": pr.get("CNTR_CODE", ""),
-                }
-                
-                geoms.append(g)
-                props.append(prop_dict)
-            except Exception:
-                continue
+        cached = _read_nuts_cache(url) if _SHAPELY_2 else None
+        if cached:
+            geoms = cached["geoms"]
+            props = cached["props"]
+            cent_lat = cached["cent_lat"]
+            cent_lon = cached["cent_lon"]
+        else:
+            geoms, props, cent_lat, cent_lon = _download_nuts_geoms(url)
+            if geoms and _SHAPELY_2:
+                _write_nuts_cache(url, geoms, props, cent_lat, cent_lon)
         
         if not geoms:
             return {"ok": False, "msg": "No valid geometries found", "tree": None, "geoms": [], "props": [], "count": 0}
         
         tree = STRtree(geoms)
-        return {"ok": True, "msg": "Success", "tree": tree, "geoms": geoms, "props": props, "count": len(geoms)}
+        geom_arr = _prepared_geom_array(geoms) if _SHAPELY_2 else None
+        return {
+            "ok": True, "msg": "Success", "tree": tree, "geoms": geoms, "props": props, "count": len(geoms),
+            "geom_arr": geom_arr,
+            "lookup": _make_tree_lookup(tree, geoms, geom_arr),
+            # Dense per-region arrays so catchment scans are one vector op per site
+            "cent_lat": np.ascontiguousarray(cent_lat, dtype=np.float64),
+            "cent_lon": np.ascontiguousarray(cent_lon, dtype=np.float64),
+            # Centroids in radians with their cosines, so per-site scans skip the trig on that side
+            "cent_lat_rad": np.radians(np.ascontiguousarray(cent_lat, dtype=np.float64)),
+            "cent_lon_rad": np.radians(np.ascontiguousarray(cent_lon, dtype=np.float64)),
+            "cent_cos": np.cos(np.radians(np.ascontiguousarray(cent_lat, dtype=np.float64))),
+            "nuts_ids": np.array([p["NUTS_ID"] or "" for p in props], dtype=object),
+            # (minx, miny, maxx, maxy) per region for cheap box prefilters
+            "bounds": (shapely.bounds(geom_arr) if _SHAPELY_2
+                       else np.array([g.bounds for g in geoms], dtype=np.float64)),
+        }
         
     except Exception as e:
         return {"ok": False, "msg": str(e), "tree": None, "geoms": [], "props": [], "count": 0}
@@ -333,6 +764,17 @@ def load_nuts2_index() -> Dict[str, Any]:
 def load_nuts3_index() -> Dict[str, Any]:
     return _load_nuts_index(NUTS3_URL)
 
+@st.cache_resource(show_spinner=False)
+def prefetch_nuts() -> List[Any]:
+    """Start the NUTS2 and NUTS3 index builds in parallel, once per process.
+    
+    Later load_nuts*_index() callers wait on (and share) the same cached results.
+    """
+    ex = ThreadPoolExecutor(max_workers=2)
+    futures = [ex.submit(load_nuts2_index), ex.submit(load_nuts3_index)]
+    ex.shutdown(wait=False)
+    return futures
+
 def _nuts_lookup_generic(idx: Dict[str, Any], lat: float, lon: float) -> Dict[str, Any]:
     """Improved NUTS point-in-polygon lookup"""
     if not idx.get("ok") or not idx.get("tree"):
@@ -340,197 +782,257 @@ def _nuts_lookup_generic(idx: Dict[str, Any], lat: float, lon: float) -> Dict[st
     
     try:
         pt = Point(float(lon), float(lat))
-        
-        # Try direct query
-        candidates_indices = []
-        try:
-            candidates_indices = list(idx["tree"].query(pt, predicate="intersects"))
-        except TypeError:
-            candidates = idx["tree"].query(pt)
-            if hasattr(candidates, '__iter__'):
-                for cand in candidates:
-                    for i, geom in enumerate(idx["geoms"]):
-                        if cand is geom or (hasattr(cand, 'equals') and cand.equals(geom)):
-                            candidates_indices.append(i)
-                            break
-        except:
-            pass
-        
-        for idx_num in candidates_indices:
-            if 0 <= idx_num < len(idx["props"]):
-                return idx["props"][idx_num]
+        indices = idx["lookup"](pt)
         
         # Try with buffer for boundary points
-        if not candidates_indices:
-            try:
-                buffered_pt = pt.buffer(0.0001)
-                candidates_indices = list(idx["tree"].query(buffered_pt, predicate="intersects"))
-            except:
-                pass
-            
-            for idx_num in candidates_indices:
-                if 0 <= idx_num < len(idx["props"]):
-                    if idx["geoms"][idx_num].contains(pt) or idx["geoms"][idx_num].intersects(pt):
-                        return idx["props"][idx_num]
+        if len(indices) == 0:
+            indices = idx["lookup"](pt.buffer(0.0001))
         
-        # Direct iteration fallback
-        for i, geom in enumerate(idx["geoms"]):
-            try:
-                if geom.contains(pt) or geom.intersects(pt):
-                    return idx["props"][i]
-            except:
-                continue
+        if len(indices):
+            return idx["props"][int(indices[0])]
     except:
         pass
     
     return {}
 
-@st.cache_data(show_spinner=False)
 def nuts2_lookup(lat: float, lon: float) -> Dict[str, Any]:
     idx = load_nuts2_index()
     if not idx.get("ok"):
         return {}
     return _nuts_lookup_generic(idx, lat, lon)
 
-@st.cache_data(show_spinner=False)
 def nuts3_lookup(lat: float, lon: float) -> Dict[str, Any]:
     idx = load_nuts3_index()
     if not idx.get("ok"):
         return {}
     return _nuts_lookup_generic(idx, lat, lon)
 
+def nuts_lookup_bulk(lats, lons, level: int = 3) -> List[Dict[str, Any]]:
+    """NUTS lookup for many points at once; results are aligned with the inputs"""
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    out: List[Dict[str, Any]] = [{} for _ in range(len(lats))]
+    idx = load_nuts2_index() if level == 2 else load_nuts3_index()
+    if not idx.get("ok") or not idx.get("tree"):
+        return out
+    
+    if _SHAPELY_2:
+        # One tree query for the whole sheet: (input_idx, tree_idx) pairs
+        pts = shapely.points(lons, lats)
+        input_idx, tree_idx = idx["tree"].query(pts)
+        hit = shapely.intersects(idx["geom_arr"][tree_idx], pts[input_idx])
+        for i, t in zip(input_idx[hit].tolist(), tree_idx[hit].tolist()):
+            if not out[i]:
+                out[i] = idx["props"][t]
+    
+    # Shapely 1.x and boundary points missed above go through the single-point path
+    for i in range(len(out)):
+        if not out[i]:
+            out[i] = _nuts_lookup_generic(idx, lats[i], lons[i])
+    return out
+
 # ---------------------- Highway/Expressway Detection ----------------------
-@st.cache_data(show_spinner=False, ttl=3600)
 def find_nearest_highway_access(lat: float, lon: float, radius_km: float = 50) -> Dict[str, Any]:
-    """Find nearest highway/expressway access point using Overpass API"""
+    """Find nearest highway/expressway access point, persistently cached per location"""
+    return find_nearest_highway_access_many([lat], [lon], radius_km)[0]
+
+def find_nearest_highway_access_many(lats: List[float], lons: List[float], radius_km: float = 50,
+                                     throttle=None) -> List[Dict[str, Any]]:
+    """find_nearest_highway_access() for many sites, with Overpass queried per batch of searches.
+    
+    Cache misses share one search per H3 cell (around the cell center, padded to cover
+    the whole cell) when h3 is installed, else one per distinct site. Nearby searches are
+    grouped up to HIGHWAY_BATCH_SITES at a time, within HIGHWAY_BATCH_SPAN_KM, into union
+    queries; each site then takes the nearest candidate within radius_km. A batch with a
+    failed strategy request is retried one search at a time. Results are persisted only
+    when every strategy request of their query succeeded. throttle, if given, is called
+    before every query.
+    """
+    out: List[Dict[str, Any]] = [{} for _ in lats]
+    
+    def _assign(cands: Dict[str, Any], idxs: List[int]) -> None:
+        for i in idxs:
+            nearest = _nearest_highway_node(cands, lats[i], lons[i], max_km=radius_km)
+            if nearest and cands["complete"]:
+                _disk_cache().set(f"highway:{_coord_key(lats[i], lons[i])}:{radius_km}", nearest)
+            out[i] = nearest
+    
+    # Search point -> sites it covers
+    groups: Dict[Any, List[int]] = {}
+    for i, (lat, lon) in enumerate(zip(lats, lons)):
+        if not (math.isfinite(lat) and math.isfinite(lon)):
+            continue  # would invalidate the whole union query
+        hit = _disk_cache().get(f"highway:{_coord_key(lat, lon)}:{radius_km}")
+        if hit is not None:
+            out[i] = hit
+            continue
+        key = h3.latlng_to_cell(lat, lon, HIGHWAY_H3_RES) if _HAS_H3 else (lat, lon)
+        groups.setdefault(key, []).append(i)
+    
+    cell_cache = _highway_cell_cache() if _HAS_H3 else {}
+    pending = []
+    for key, idxs in groups.items():
+        cands = cell_cache.get((key, radius_km))
+        if cands is not None:
+            _assign(cands, idxs)
+        else:
+            pending.append(key)
+    
+    # Sweep the search points by latitude band, then longitude, so batches stay compact
+    points = {k: h3.cell_to_latlng(k) if _HAS_H3 else k for k in pending}
+    pending.sort(key=lambda k: (round(points[k][0]), points[k][1]))
+    batches: List[List[Any]] = []
+    for key in pending:
+        if batches and len(batches[-1]) < HIGHWAY_BATCH_SITES:
+            lat0, lon0 = points[batches[-1][0]]
+            if haversine_km(lat0, lon0, *points[key]) <= HIGHWAY_BATCH_SPAN_KM:
+                batches[-1].append(key)
+                continue
+        batches.append([key])
+    
+    search_km = radius_km + HIGHWAY_H3_PAD_KM if _HAS_H3 else radius_km
+    while batches:
+        chunk = batches.pop(0)
+        if throttle:
+            throttle()
+        cands = _overpass_highway_nodes_many([points[k] for k in chunk], search_km)
+        if not cands["complete"] and len(chunk) > 1:
+            # A failed union (usually a server-side timeout) is retried per search point
+            batches.extend([k] for k in chunk)
+            continue
+        for key in chunk:
+            if _HAS_H3 and cands["complete"]:
+                cell_cache[(key, radius_km)] = cands
+            _assign(cands, groups[key])
+    return out
+
+@st.cache_resource(show_spinner=False)
+def _highway_cell_cache() -> Dict[Any, Dict[str, Any]]:
+    """(H3 cell, radius) -> Overpass candidate nodes, shared by all sites in the cell"""
+    return {}
+
+def _overpass_highway_nodes_many(points: List[Tuple[float, float]], radius_km: float) -> Dict[str, Any]:
+    """Candidate access nodes around several points from every Overpass strategy, with flat
+    coordinate arrays. Each strategy is one union query over all points.
     
-    # Try multiple query strategies
+    "complete" is False if any strategy request failed.
+    """
+    # Shared by every strategy, so the per-site clauses are formatted once per batch
+    arounds = [f"(around:{radius_km * 1000},{lat},{lon});" for lat, lon in points]
     queries = [
-        # Strategy 1: Motorway junctions (most specific)
-        f"""
-        [out:json][timeout:30];
-        (
-          node["highway"="motorway_junction"](around:{radius_km * 1000},{lat},{lon});
-        );
-        out body;
-        """,
-        
-        # Strategy 2: Motorway and trunk links
-        f"""
-        [out:json][timeout:30];
-        (
-          way["highway"~"motorway_link|trunk_link|motorway|trunk"](around:{radius_km * 1000},{lat},{lon});
-          node(w);
-        );
-        out body;
-        """,
-        
-        # Strategy 3: Primary roads (major roads)
-        f"""
-        [out:json][timeout:30];
-        (
-          way["highway"~"primary|secondary"](around:{radius_km * 1000},{lat},{lon});
-          node(w);
-        );
-        out body;
-        """,
-        
-        # Strategy 4: Any highway access
-        f"""
-        [out:json][timeout:30];
-        (
-          node["highway"~"motorway|trunk|primary"](around:{radius_km * 1000},{lat},{lon});
-        );
-        out body;
-        """
+        OVERPASS_UNION_TMPL.format(clauses="\n".join(stmt + a for a in arounds),
+                                   recurse="node(w);\n" if recurse else "")
+        for stmt, recurse in OVERPASS_HIGHWAY_STRATEGIES
     ]
     
-    min_dist = float('inf')
-    nearest = None
+    nodes = []
+    lat_parts = []
+    lon_parts = []
+    strategy_parts = []
+    complete = True
     
     for query_idx, query in enumerate(queries):
         try:
-            response = requests.post(
+            response = _http_session().post(
                 OVERPASS_URL,
                 data=query,
                 headers={'Content-Type': 'application/x-www-form-urlencoded'},
-                timeout=30
+                timeout=OVERPASS_TIMEOUT_S + 10
             )
             
             if response.status_code != 200:
+                complete = False
                 continue
                 
-            data = response.json()
+            data = _json_loads(response.content)
             
-            if not data.get('elements'):
+            # Keep every node from every strategy; the closest is picked across ALL strategies
+            found = [e for e in data.get('elements', ())
+                     if e.get('type') == 'node' and 'lat' in e and 'lon' in e]
+            if not found:
                 continue
-            
-            # Process elements - find closest in THIS query
-            for element in data.get('elements', []):
-                if element['type'] == 'node' and 'lat' in element and 'lon' in element:
-                    node_lat = element['lat']
-                    node_lon = element['lon']
-                    dist = haversine_km(lat, lon, node_lat, node_lon)
-                    
-                    # Track the closest across ALL strategies
-                    if dist < min_dist:
-                        min_dist = dist
-                        nearest = {
-                            'lat': node_lat,
-                            'lon': node_lon,
-                            'distance_straight_km': round(dist, 2),
-                            'name': element.get('tags', {}).get('name', ''),
-                            'ref': element.get('tags', {}).get('ref', ''),
-                            'highway_type': element.get('tags', {}).get('highway', 'junction'),
-                            'id': element.get('id'),
-                            'strategy': query_idx + 1
-                        }
-            
-            # Continue to next strategy - don't return yet!
+            nodes.extend(found)
+            lat_parts.append(np.fromiter((e['lat'] for e in found), dtype=np.float64, count=len(found)))
+            lon_parts.append(np.fromiter((e['lon'] for e in found), dtype=np.float64, count=len(found)))
+            strategy_parts.append(np.full(len(found), query_idx + 1, dtype=np.int64))
                 
         except requests.exceptions.Timeout:
+            complete = False
             continue
         except requests.exceptions.RequestException:
+            complete = False
             continue
         except Exception:
+            complete = False
             continue
     
-    return nearest if nearest else {}
+    return {
+        "nodes": nodes,
+        "strategy": np.concatenate(strategy_parts) if strategy_parts else np.empty(0, dtype=np.int64),
+        "lat": np.concatenate(lat_parts) if lat_parts else np.empty(0, dtype=np.float64),
+        "lon": np.concatenate(lon_parts) if lon_parts else np.empty(0, dtype=np.float64),
+        "complete": complete,
+    }
+
+def _nearest_highway_node(cands: Dict[str, Any], lat: float, lon: float,
+                          max_km: Optional[float] = None) -> Dict[str, Any]:
+    """Pick the candidate node closest to (lat, lon) in one vectorized pass"""
+    if not cands["nodes"]:
+        return {}
+    best_i, dist = nearest_haversine_idx(lat, lon, cands["lat"], cands["lon"])
+    if best_i < 0 or (max_km is not None and dist > max_km):
+        return {}
+    element = cands["nodes"][best_i]
+    tags = element.get('tags', {})
+    return {
+        'lat': element['lat'],
+        'lon': element['lon'],
+        'distance_straight_km': round(dist, 2),
+        'name': tags.get('name', ''),
+        'ref': tags.get('ref', ''),
+        'highway_type': tags.get('highway', 'junction'),
+        'id': element.get('id'),
+        'strategy': int(cands["strategy"][best_i])
+    }
 
 def get_highway_distance(site_lat: float, site_lon: float, route_cache: Dict = None, progress_hook=None) -> Tuple[Optional[float], Optional[float], Optional[str]]:
     """Calculate road distance to nearest highway/expressway access"""
-    if route_cache is None:
-        route_cache = {}
-    
     try:
         highway_access = find_nearest_highway_access(site_lat, site_lon, radius_km=50)
-        
-        if not highway_access or not highway_access.get('lat'):
-            return None, None, None
-        
-        try:
-            origin = (site_lat, site_lon)
-            dest = (float(highway_access['lat']), float(highway_access['lon']))
-            
-            dist_km, dur_min = get_route(origin, dest, route_cache=route_cache)
-            
-            access_name = ""
-            if highway_access.get('name'):
-                access_name = highway_access['name']
-            elif highway_access.get('ref'):
-                access_name = f"Highway {highway_access['ref']}"
-            else:
-                access_name = "Highway Access (junction)"
-            
-            return dist_km, dur_min, access_name
-        except Exception as route_err:
-            # If routing fails, use straight-line distance as fallback
-            straight_dist = highway_access.get('distance_straight_km')
-            if straight_dist:
-                return straight_dist, None, "Highway Access"
-            return None, None, None
-    except Exception as e:
+    except Exception:
+        return None, None, None
+    if not highway_access or not highway_access.get('lat'):
+        return None, None, None
+    dest = (float(highway_access['lat']), float(highway_access['lon']))
+    route = get_routes_many([((site_lat, site_lon), [dest])], route_cache=route_cache)[0][0]
+    return _highway_result(highway_access, route)
+
+def _highway_result(highway_access: Dict[str, Any], route: Any) -> Tuple[Optional[float], Optional[float], Optional[str]]:
+    """Road distance, time and label for a site's highway access point.
+    
+    route is the (distance_km, duration_min) tuple to the access point, or the exception
+    raised while routing it.
+    """
+    if not highway_access or not highway_access.get('lat'):
         return None, None, None
+    
+    if isinstance(route, Exception) or route is None:
+        # If routing fails, use straight-line distance as fallback
+        straight_dist = highway_access.get('distance_straight_km')
+        if straight_dist:
+            return straight_dist, None, "Highway Access"
+        return None, None, None
+    
+    dist_km, dur_min = route
+    access_name = ""
+    if highway_access.get('name'):
+        access_name = highway_access['name']
+    elif highway_access.get('ref'):
+        access_name = f"Highway {highway_access['ref']}"
+    else:
+        access_name = "Highway Access (junction)"
+    
+    return dist_km, dur_min, access_name
 
 # ---------------------- Eurostat API Integration ----------------------
 @st.cache_data(show_spinner=False, ttl=86400)
@@ -548,39 +1050,47 @@ def fetch_eurostat_data(dataset_code: str, filters: Dict[str, List[str]] = None)
                 filter_str = "?" + "&".join(filter_parts)
         
         url = f"{EUROSTAT_DATA_V2}/{dataset_code}{filter_str}"
-        response = requests.get(url, params=params, timeout=30)
+        response = _http_session().get(url, params=params, timeout=30)
         response.raise_for_status()
-        data = response.json()
+        data = _json_loads(response.content)
         
         dimensions = data.get("dimension", {})
         values = data.get("value", {})
+        if not values:
+            return pd.DataFrame()
         
-        dim_data = {}
-        dim_positions = {}
+        # Position -> category key/label arrays per dimension (JSON-stat row-major order)
+        dim_names = list(data.get("id") or dimensions.keys())
+        dim_sizes = []
+        dim_keys = {}
+        dim_labels = {}
+        for dim_name in dim_names:
+            category = dimensions.get(dim_name, {}).get("category", {})
+            labels = category.get("label", {})
+            index = category.get("index") or {k: i for i, k in enumerate(labels)}
+            if isinstance(index, list):
+                index = {k: i for i, k in enumerate(index)}
+            keys = [None] * len(index)
+            for key, pos in index.items():
+                keys[pos] = key
+            dim_sizes.append(len(keys))
+            dim_keys[dim_name] = np.array(keys, dtype=object)
+            dim_labels[dim_name] = np.array([labels.get(k) for k in keys], dtype=object)
         
-        for dim_name, dim_info in dimensions.items():
-            dim_data[dim_name] = dim_info.get("category", {}).get("index", {})
-            dim_positions[dim_name] = dim_info.get("category", {}).get("label", {})
+        if isinstance(values, list):
+            flat_idx = np.array([i for i, v in enumerate(values) if v is not None], dtype=np.int64)
+            vals = np.array([values[i] for i in flat_idx], dtype=np.float64)
+        else:
+            flat_idx = np.fromiter((int(k) for k in values.keys()), dtype=np.int64, count=len(values))
+            vals = np.array(list(values.values()), dtype=np.float64)
         
-        records = []
-        for idx_str, value in values.items():
-            idx = int(idx_str)
-            record = {"value": value}
-            
-            temp_idx = idx
-            for dim_name in reversed(list(dimensions.keys())):
-                dim_size = len(dim_data[dim_name])
-                dim_idx = temp_idx % dim_size
-                temp_idx = temp_idx // dim_size
-                
-                for key, pos in dim_data[dim_name].items():
-                    if pos == dim_idx:
-                        record[dim_name] = key
-                        if dim_name in dim_positions and key in dim_positions[dim_name]:
-                            record[f"{dim_name}_label"] = dim_positions[dim_name][key]
-                        break
-            
-            records.append(record)
+        # Decode all flat indices into per-dimension positions at once
+        coords = np.unravel_index(flat_idx, dim_sizes)
+        
+        records = {"value": vals}
+        for dim_name, pos in zip(dim_names, coords):
+            records[dim_name] = dim_keys[dim_name][pos]
+            records[f"{dim_name}_label"] = dim_labels[dim_name][pos]
         
         return pd.DataFrame(records)
     except:
@@ -685,21 +1195,23 @@ def calculate_catchment_area(site_lat: float, site_lon: float, radius_km: float
         if not nuts3_idx.get("ok"):
             return results
         
-        nearby_nuts3 = []
-        nearby_distances = []
+        # Box prefilter: a region's centroid lies inside its bounding box, so any region
+        # whose centroid is within radius_km has a box overlapping the search box
+        dlat = radius_km / 110.0
+        dlon = radius_km / (110.0 * max(math.cos(math.radians(min(abs(site_lat) + dlat, 89.0))), 0.01))
+        b = nuts3_idx["bounds"]
+        cand = np.flatnonzero((b[:, 0] <= site_lon + dlon) & (b[:, 2] >= site_lon - dlon) &
+                              (b[:, 1] <= site_lat + dlat) & (b[:, 3] >= site_lat - dlat))
         
-        for i, geom in enumerate(nuts3_idx["geoms"]):
-            try:
-                centroid = geom.centroid
-                dist_km = haversine_km(site_lat, site_lon, centroid.y, centroid.x)
-                
-                if dist_km <= radius_km:
-                    nuts3_code = nuts3_idx["props"][i].get("NUTS_ID")
-                    if nuts3_code:
-                        nearby_nuts3.append(nuts3_code)
-                        nearby_distances.append(dist_km)
-            except:
-                continue
+        # Centroid distances for the candidates in one vectorized pass, then mask by radius
+        slat_rad = math.radians(site_lat)
+        dists = haversine_km_pre(slat_rad, math.radians(site_lon), math.cos(slat_rad),
+                                 nuts3_idx["cent_lat_rad"][cand], nuts3_idx["cent_lon_rad"][cand],
+                                 nuts3_idx["cent_cos"][cand])
+        ids = nuts3_idx["nuts_ids"][cand]
+        mask = (dists <= radius_km) & (ids != "")
+        nearby_nuts3 = ids[mask].tolist()
+        nearby_distances = dists[mask].tolist()
         
         if not nearby_nuts3:
             containing = nuts3_lookup(site_lat, site_lon)
@@ -712,31 +1224,18 @@ def calculate_catchment_area(site_lat: float, site_lon: float, radius_km: float
             unemployed_data = get_nuts3_unemployed_persons(nearby_nuts3, year)
             active_pop_data = get_nuts3_active_population(nearby_nuts3, year)
             
-            total_pop = 0
-            total_unemployed = 0
-            total_active = 0
-            weights = []
-            
-            for nuts3_code, dist in zip(nearby_nuts3, nearby_distances):
-                weight = 1.0 / (1.0 + dist / 10.0)
-                weights.append(weight)
-                
-                if nuts3_code in pop_data:
-                    total_pop += pop_data[nuts3_code] * weight
-                
-                if nuts3_code in unemployed_data:
-                    total_unemployed += unemployed_data[nuts3_code] * weight
-                
-                if nuts3_code in active_pop_data:
-                    total_active += active_pop_data[nuts3_code] * weight
-                elif nuts3_code in pop_data:
-                    total_active += pop_data[nuts3_code] * 0.65 * weight
+            # Inverse-distance weighted averages over aligned per-region arrays
+            dists = np.asarray(nearby_distances, dtype=np.float64)
+            pop = np.array([pop_data.get(c, np.nan) for c in nearby_nuts3], dtype=np.float64)
+            une = np.array([unemployed_data.get(c, np.nan) for c in nearby_nuts3], dtype=np.float64)
+            act = np.array([active_pop_data.get(c, np.nan) for c in nearby_nuts3], dtype=np.float64)
+            act = np.where(np.isnan(act), pop * 0.65, act)
+            weights = 1.0 / (1.0 + dists / 10.0)
+            total_weight = weights.sum()
             
-            if weights:
-                total_weight = sum(weights)
-                total_pop = total_pop / total_weight
-                total_unemployed = total_unemployed / total_weight
-                total_active = total_active / total_weight
+            total_pop = np.nansum(pop * weights) / total_weight
+            total_unemployed = np.nansum(une * weights) / total_weight
+            total_active = np.nansum(act * weights) / total_weight
             
             results["total_population"] = int(total_pop)
             results["unemployed_persons"] = int(total_unemployed)
@@ -749,15 +1248,26 @@ def calculate_catchment_area(site_lat: float, site_lon: float, radius_km: float
     return results
 
 # ---------------------- OSM Geocoding ----------------------
-@st.cache_data(show_spinner=False)
+@functools.lru_cache(maxsize=4096)
 def osm_reverse(lat: float, lon: float) -> Dict[str, Any]:
-    """Reverse geocode coordinates to get administrative information"""
+    """Reverse geocode coordinates to get administrative information.
+    
+    In-process LRU in front of st.cache_data and the disk cache; callers pass rounded
+    coordinates and must treat the returned dict as read-only.
+    """
+    return _osm_reverse_cached(lat, lon)
+
+@st.cache_data(show_spinner=False)
+def _osm_reverse_cached(lat: float, lon: float) -> Dict[str, Any]:
+    key = f"reverse:{_coord_key(lat, lon)}"
+    hit = _disk_cache().get(key)
+    if hit is not None:
+        return hit
     params = {"format": "jsonv2", "lat": float(lat), "lon": float(lon), "addressdetails": 1, "extratags": 1}
-    headers = {"User-Agent": "RoadDistanceFinder/2.0"}
     try:
-        r = requests.get(NOMINATIM_REVERSE, params=params, headers=headers, timeout=12)
+        r = _nominatim_get(NOMINATIM_REVERSE, params)
         r.raise_for_status()
-        data = r.json()
+        data = _json_loads(r.content)
         addr = data.get("address", {})
         ex = data.get("extratags", {})
         municipality = addr.get("municipality") or addr.get("city") or addr.get("town") or addr.get("village") or addr.get("suburb")
@@ -766,7 +1276,7 @@ def osm_reverse(lat: float, lon: float) -> Dict[str, Any]:
         muni_code = ex.get("ref:teryt:simc") or ex.get("ref:teryt") or ""
         county_code = ex.get("ref:teryt:powiat") or ""
         voiv_code = ex.get("ref:teryt:wojewodztwo") or addr.get("ISO3166-2-lvl4") or ""
-        return {
+        out = {
             "municipality": municipality or "",
             "municipality_code": muni_code,
             "county": county or "",
@@ -774,6 +1284,8 @@ def osm_reverse(lat: float, lon: float) -> Dict[str, Any]:
             "voivodeship": voivodeship or "",
             "voivodeship_code": voiv_code,
         }
+        _disk_cache().set(key, out)
+        return out
     except:
         return {"municipality": "", "municipality_code": "", "county": "", "county_code": "", 
                 "voivodeship": "", "voivodeship_code": ""}
@@ -784,11 +1296,10 @@ def osm_search(query: str, limit: int = 5) -> List[Dict[str, Any]]:
     if not query:
         return []
     params = {"q": query, "format": "json", "addressdetails": 1, "limit": limit}
-    headers = {"User-Agent": "RoadDistanceFinder/2.0"}
     try:
-        r = requests.get(NOMINATIM_SEARCH, params=params, headers=headers, timeout=12)
+        r = _nominatim_get(NOMINATIM_SEARCH, params)
         r.raise_for_status()
-        results = r.json()
+        results = _json_loads(r.content)
         out = []
         for res in results:
             try:
@@ -807,10 +1318,10 @@ def osm_search(query: str, limit: int = 5) -> List[Dict[str, Any]]:
 def route_via_osrm(origin: Tuple[float, float], dest: Tuple[float, float], timeout_s: int = 20) -> Tuple[float, float]:
     """Get road distance and time via OSRM"""
     url = OSRM_URL.format(lon1=origin[1], lat1=origin[0], lon2=dest[1], lat2=dest[0])
-    r = requests.get(url, timeout=timeout_s)
+    r = _http_session().get(url, timeout=timeout_s)
     if r.status_code != 200:
         raise RuntimeError(f"OSRM HTTP {r.status_code}")
-    data = r.json()
+    data = _json_loads(r.content)
     if data.get("code") != "Ok":
         raise RuntimeError(f"OSRM error: {data.get('code')}")
     route = data["routes"][0]
@@ -818,10 +1329,13 @@ def route_via_osrm(origin: Tuple[float, float], dest: Tuple[float, float], timeo
     dur_min = float(route["duration"]) / 60.0
     return dist_km, dur_min
 
-@st.cache_data(show_spinner=False)
 def _route_key(origin: Tuple[float, float], dest: Tuple[float, float]) -> str:
     return f"OSRM:{origin[0]:.6f},{origin[1]:.6f}->{dest[0]:.6f},{dest[1]:.6f}"
 
+def _route_disk_key(origin: Tuple[float, float], dest: Tuple[float, float]) -> str:
+    """Persistent route key; ~11 m rounding is below OSRM's snapping resolution"""
+    return f"osrm:{_coord_key(origin[0], origin[1], dest[0], dest[1], decimals=ROUTE_KEY_DECIMALS)}"
+
 def get_route(origin: Tuple[float, float], dest: Tuple[float, float], route_cache: Dict = None) -> Tuple[float, float]:
     """Get route with caching"""
     if route_cache is None:
@@ -830,79 +1344,267 @@ def get_route(origin: Tuple[float, float], dest: Tuple[float, float], route_cach
     if key in route_cache:
         v = route_cache[key]
         return v["distance_km"], v["duration_min"]
-    dist_km, dur_min = route_via_osrm(origin, dest)
+    disk_key = _route_disk_key(origin, dest)
+    hit = _disk_cache().get(disk_key)
+    if hit is not None:
+        dist_km, dur_min = hit
+    else:
+        dist_km, dur_min = route_via_osrm(origin, dest)
+        _disk_cache().set(disk_key, [dist_km, dur_min])
     route_cache[key] = {"distance_km": dist_km, "duration_min": dur_min}
     return dist_km, dur_min
 
+def route_matrix_via_osrm(origins: List[Tuple[float, float]], dests: List[Tuple[float, float]],
+                          timeout_s: int = 60) -> Tuple[np.ndarray, np.ndarray]:
+    """Road distance (km) and time (min) matrices, origins x dests, from one OSRM /table call.
+    
+    Unroutable pairs come back as NaN.
+    """
+    n = len(origins)
+    coords = ";".join(f"{lon},{lat}" for lat, lon in list(origins) + list(dests))
+    url = OSRM_TABLE_URL.format(coords=coords, sources=";".join(str(i) for i in range(n)),
+                                destinations=";".join(str(n + j) for j in range(len(dests))))
+    r = _http_session().get(url, timeout=timeout_s)
+    if r.status_code != 200:
+        raise RuntimeError(f"OSRM HTTP {r.status_code}")
+    data = _json_loads(r.content)
+    if data.get("code") != "Ok":
+        raise RuntimeError(f"OSRM error: {data.get('code')}")
+    dist_km = np.array([[np.nan if v is None else v for v in row] for row in data["distances"]], dtype=float) / 1000.0
+    dur_min = np.array([[np.nan if v is None else v for v in row] for row in data["durations"]], dtype=float) / 60.0
+    return dist_km, dur_min
+
+def get_routes_many(jobs: List[Tuple[Tuple[float, float], List[Tuple[float, float]]]], route_cache: Dict = None,
+                    throttle=None, max_workers: int = OSRM_MAX_WORKERS, progress=None) -> List[List[Any]]:
+    """Routes for many (origin, dests) jobs, each list in dests order, with caching.
+    
+    Cache misses of all jobs are fetched together, once per _route_disk_key, in OSRM
+    /table requests of at most OSRM_TABLE_MAX_COORDS coordinates; pairs of a block
+    whose request fails are routed one by one. Each entry is a (distance_km, duration_min) tuple, or the exception
+    raised for that pair. throttle, if given, is called before every /table request;
+    progress, if given, is called as progress(done, total) from the calling thread
+    before the first block and after every block.
+    """
+    if route_cache is None:
+        route_cache = {}
+    out: List[List[Any]] = [[None] * len(dests) for _, dests in jobs]
+    missing: Dict[Tuple[float, float], Dict[Tuple[float, float], List[Tuple[int, int]]]] = {}
+    first_pair: Dict[str, Tuple[Tuple[float, float], Tuple[float, float]]] = {}
+    for j, (origin, dests) in enumerate(jobs):
+        for k, dest in enumerate(dests):
+            key = _route_key(origin, dest)
+            if key in route_cache:
+                v = route_cache[key]
+                out[j][k] = (v["distance_km"], v["duration_min"])
+                continue
+            disk_key = _route_disk_key(origin, dest)
+            hit = _disk_cache().get(disk_key)
+            if hit is not None:
+                out[j][k] = (hit[0], hit[1])
+                route_cache[key] = {"distance_km": hit[0], "duration_min": hit[1]}
+                continue
+            # Pairs sharing a persistent key (sites a few metres apart) are requested once
+            o, d = first_pair.setdefault(disk_key, (origin, dest))
+            missing.setdefault(o, {}).setdefault(d, []).append((j, k))
+    if not missing:
+        return out
+    
+    # Blocks of origins x dests, sized so each request stays under the coordinate limit
+    origins = list(missing)
+    all_dests = list(dict.fromkeys(d for m in missing.values() for d in m))
+    d_step = min(len(all_dests), max(OSRM_TABLE_MAX_COORDS // 2, OSRM_TABLE_MAX_COORDS - len(origins)))
+    o_step = OSRM_TABLE_MAX_COORDS - d_step
+    blocks = []
+    for oi in range(0, len(origins), o_step):
+        o_chunk = origins[oi:oi + o_step]
+        for di in range(0, len(all_dests), d_step):
+            d_chunk = all_dests[di:di + d_step]
+            d_set = set(d_chunk)
+            if any(d in d_set for o in o_chunk for d in missing[o]):
+                blocks.append((o_chunk, d_chunk))
+    
+    def _block(block):
+        if throttle:
+            throttle()
+        try:
+            return route_matrix_via_osrm(*block)
+        except Exception as e:
+            return e
+    
+    if progress:
+        progress(0, len(blocks))
+    if max_workers <= 1 or len(blocks) <= 1:
+        block_res = []
+        for b in blocks:
+            block_res.append(_block(b))
+            if progress:
+                progress(len(block_res), len(blocks))
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(blocks))) as ex:
+            futures = [ex.submit(_block, b) for b in blocks]
+            for n, _ in enumerate(as_completed(futures), 1):
+                if progress:
+                    progress(n, len(blocks))
+            block_res = [f.result() for f in futures]
+    
+    for (o_chunk, d_chunk), res in zip(blocks, block_res):
+        pairs = [(oi, di) for oi, o in enumerate(o_chunk) for di, d in enumerate(d_chunk) if d in missing[o]]
+        if isinstance(res, Exception):
+            fallback = route_via_osrm_bulk([(o_chunk[oi], d_chunk[di]) for oi, di in pairs],
+                                           route_cache=route_cache, throttle=throttle)
+        else:
+            fallback = None
+        for n, (oi, di) in enumerate(pairs):
+            origin, dest = o_chunk[oi], d_chunk[di]
+            if fallback is not None:
+                val = fallback[n]
+            else:
+                d, t = res[0][oi, di], res[1][oi, di]
+                if np.isfinite(d) and np.isfinite(t):
+                    val = (float(d), float(t))
+                    route_cache[_route_key(origin, dest)] = {"distance_km": val[0], "duration_min": val[1]}
+                    _disk_cache().set(_route_disk_key(origin, dest), list(val))
+                else:
+                    val = RuntimeError("OSRM error: NoRoute")
+            for j, k in missing[origin][dest]:
+                out[j][k] = val
+    return out
+
+def route_via_osrm_bulk(pairs: List[Tuple[Tuple[float, float], Tuple[float, float]]], route_cache: Dict = None,
+                        max_workers: int = OSRM_MAX_WORKERS, throttle=None) -> List[Any]:
+    """Route many (origin, dest) pairs concurrently, in input order.
+    
+    Each entry is a (distance_km, duration_min) tuple, or the exception raised for that pair.
+    throttle, if given, is called before every /route request.
+    """
+    if route_cache is None:
+        route_cache = {}
+    
+    def _one(pair):
+        try:
+            if throttle:
+                throttle()
+            return get_route(pair[0], pair[1], route_cache=route_cache)
+        except Exception as e:
+            return e
+    
+    if len(pairs) <= 1:
+        return [_one(p) for p in pairs]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(pairs))) as ex:
+        return list(ex.map(_one, pairs))
+
 # ---------------------- National Admin Boundaries ----------------------
 class AdminIndex:
     def __init__(self, geoms: List[Any], props: List[Dict[str, Any]]):
         self.geoms = geoms
         self.props = props
         self.tree = STRtree(geoms) if (geoms and _HAS_SHAPELY) else None
+        # Prepared polygons keep their GEOS point-in-polygon index across queries
+        self.geom_arr = _prepared_geom_array(geoms) if (self.tree is not None and _SHAPELY_2) else None
+        self._match = _make_tree_lookup(self.tree, geoms, self.geom_arr) if self.tree is not None else None
 
     def lookup(self, lat: float, lon: float) -> Dict[str, Any]:
         if not self.tree:
             return {}
-        pt = Point(float(lon), float(lat))
         try:
-            cands = self.tree.query(pt)
+            ixs = self._match(Point(float(lon), float(lat)))
         except:
-            cands = []
-        for g in cands:
-            try:
-                if g.covers(pt) or g.contains(pt) or g.intersects(pt):
-                    try:
-                        ix = self.geoms.index(g)
-                    except:
-                        ix = None
-                    if ix is not None:
-                        return self.props[ix]
-            except:
-                continue
-        for ix, g in enumerate(self.geoms):
-            try:
-                if g.covers(pt) or g.contains(pt) or g.intersects(pt):
-                    return self.props[ix]
-            except:
-                continue
-        return {}
+            return {}
+        return self.props[int(ixs[0])] if len(ixs) else {}
+
+    def lookup_many(self, lats, lons) -> List[Dict[str, Any]]:
+        """lookup() for many points at once; results are aligned with the inputs"""
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        if not self.tree or not _SHAPELY_2:
+            return [self.lookup(la, lo) for la, lo in zip(lats, lons)]
+        out: List[Dict[str, Any]] = [{} for _ in range(len(lats))]
+        # One tree query for all points: (input_idx, tree_idx) pairs, confirmed
+        # against the prepared polygons
+        pts = shapely.points(lons, lats)
+        input_ix, tree_ix = self.tree.query(pts)
+        hit = shapely.intersects(self.geom_arr[tree_ix], pts[input_ix])
+        for i, t in zip(input_ix[hit].tolist(), tree_ix[hit].tolist()):
+            if not out[i]:
+                out[i] = self.props[t]
+        return out
+
+def _admin_props(pr: Dict[str, Any], code_field: str, name_field: str,
+                 alt_code_fields=None, alt_name_fields=None) -> Dict[str, str]:
+    code_val = pr.get(code_field)
+    name_val = pr.get(name_field)
+    if (not code_val) and alt_code_fields:
+        for cf in alt_code_fields:
+            if pr.get(cf):
+                code_val = pr.get(cf)
+                break
+    if (not name_val) and alt_name_fields:
+        for nf in alt_name_fields:
+            if pr.get(nf):
+                name_val = pr.get(nf)
+                break
+    return {"code": str(code_val or ""), "name": str(name_val or "")}
 
 def build_admin_index_from_geojson(gj: Dict[str, Any], code_field: str, name_field: str, 
                                   alt_code_fields=None, alt_name_fields=None) -> Optional[AdminIndex]:
     if not _HAS_SHAPELY:
         return None
     try:
-        geoms = []
-        props = []
-        for feat in gj.get("features", []):
-            pr = feat.get("properties", {})
-            try:
-                g = shape(feat.get("geometry"))
-                if g.is_empty:
+        if _SHAPELY_2:
+            # Parse all geometries in one vectorized call instead of shape() per feature
+            features = [f for f in gj.get("features", []) if f.get("geometry")]
+            raw = np.array([_json_dumps(f["geometry"]) for f in features], dtype=object)
+            geom_arr = shapely.from_geojson(raw, on_invalid="ignore")
+            keep = shapely.is_geometry(geom_arr) & ~shapely.is_empty(geom_arr)
+            geoms = geom_arr[keep].tolist()
+            props = [_admin_props(f.get("properties") or {}, code_field, name_field, alt_code_fields, alt_name_fields)
+                     for f, k in zip(features, keep.tolist()) if k]
+        else:
+            geoms = []
+            props = []
+            for feat in gj.get("features", []):
+                pr = feat.get("properties") or {}
+                try:
+                    g = shape(feat.get("geometry"))
+                    if g.is_empty:
+                        continue
+                    geoms.append(g)
+                    props.append(_admin_props(pr, code_field, name_field, alt_code_fields, alt_name_fields))
+                except:
                     continue
-                code_val = pr.get(code_field)
-                name_val = pr.get(name_field)
-                if (not code_val) and alt_code_fields:
-                    for cf in alt_code_fields:
-                        if pr.get(cf):
-                            code_val = pr.get(cf)
-                            break
-                if (not name_val) and alt_name_fields:
-                    for nf in alt_name_fields:
-                        if pr.get(nf):
-                            name_val = pr.get(nf)
-                            break
-                geoms.append(g)
-                props.append({"code": str(code_val or ""), "name": str(name_val or "")})
-            except:
-                continue
         if not geoms:
             return None
         return AdminIndex(geoms, props)
     except:
         return None
 
+def _admin_cache_path(url: str) -> str:
+    return os.path.join(CACHE_DIR, f"admin_{hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]}.pkl")
+
+def _read_admin_cache(url: str) -> Optional[AdminIndex]:
+    """Rebuild an AdminIndex saved by _write_admin_cache, if fresh"""
+    path = _admin_cache_path(url)
+    try:
+        if time.time() - os.path.getmtime(path) > ADMIN_CACHE_TTL_S:
+            return None
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+        return AdminIndex(list(shapely.from_wkb(data["wkb"])), data["props"])
+    except Exception:
+        return None
+
+def _write_admin_cache(url: str, idx: AdminIndex) -> None:
+    path = _admin_cache_path(url)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        data = {"wkb": shapely.to_wkb(idx.geom_arr), "props": idx.props}
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except Exception:
+        pass
+
 @st.cache_resource(show_spinner=False)
 def load_official_PL() -> Dict[str, Any]:
     """Load Polish administrative boundaries"""
@@ -915,16 +1617,22 @@ def load_official_PL() -> Dict[str, Any]:
     }
     out = {}
     for level, url in urls.items():
+        idx = _read_admin_cache(url) if _SHAPELY_2 else None
+        if idx:
+            out[level] = idx
+            continue
         try:
-            r = requests.get(url, timeout=60)
+            r = _http_session().get(url, timeout=60)
             r.raise_for_status()
-            gj = r.json()
+            gj = _json_loads(r.content)
             idx = build_admin_index_from_geojson(
                 gj, code_field="JPT_KOD_JE", name_field="JPT_NAZWA_",
                 alt_code_fields=["TERYT", "TERC"], alt_name_fields=["NAZWA"]
             )
             if idx:
                 out[level] = idx
+                if _SHAPELY_2:
+                    _write_admin_cache(url, idx)
         except:
             continue
     return out
@@ -936,11 +1644,19 @@ if "official_admin" not in st.session_state:
 @st.cache_resource(show_spinner=False)
 def load_index_from_url(url: str, code_field: str, name_field: str, 
                         alt_code_fields: List[str] = None, alt_name_fields: List[str] = None) -> Optional[AdminIndex]:
+    # The field mapping is part of the key: the same URL can be indexed on different fields
+    cache_key = "|".join([url, code_field, name_field] + list(alt_code_fields or []) + list(alt_name_fields or []))
+    idx = _read_admin_cache(cache_key) if _SHAPELY_2 else None
+    if idx:
+        return idx
     try:
-        r = requests.get(url, timeout=90)
+        r = _http_session().get(url, timeout=90)
         r.raise_for_status()
-        gj = r.json()
-        return build_admin_index_from_geojson(gj, code_field, name_field, alt_code_fields, alt_name_fields)
+        gj = _json_loads(r.content)
+        idx = build_admin_index_from_geojson(gj, code_field, name_field, alt_code_fields, alt_name_fields)
+        if idx and _SHAPELY_2:
+            _write_admin_cache(cache_key, idx)
+        return idx
     except:
         return None
 
@@ -964,12 +1680,12 @@ def process_batch(
     airports: pd.DataFrame,
     seaports: pd.DataFrame,
     topn: int,
-    include_ref: bool,
-    ref_lat: float,
-    ref_lon: float,
-    ref_name: str,
-    pause_every: int,
-    pause_secs: float,
+    include_ref: bool = False,
+    ref_lat: Optional[float] = None,
+    ref_lon: Optional[float] = None,
+    ref_name: Optional[str] = None,
+    pause_every: int = 0,
+    pause_secs: float = 0.0,
     progress_hook=None,
     enrich_nuts3: bool = True,
     enrich_osm_admin: bool = True,
@@ -979,7 +1695,7 @@ def process_batch(
 ) -> Tuple[pd.DataFrame, List[Dict[str, Any]], int]:
     """Main processing function with all features"""
     
-    sites = sites.copy()
+    sites = sites.reset_index(drop=True)
     airports = airports.copy()
     seaports = seaports.copy()
     
@@ -996,140 +1712,337 @@ def process_batch(
     if err:
         raise ValueError(err)
     
-    a_lat = airports["Latitude"].to_numpy()
-    a_lon = airports["Longitude"].to_numpy()
-    p_lat = seaports["Latitude"].to_numpy()
-    p_lon = seaports["Longitude"].to_numpy()
+    a_lat_deg = airports["Latitude"].to_numpy(dtype=float)
+    a_lon_deg = airports["Longitude"].to_numpy(dtype=float)
+    p_lat_deg = seaports["Latitude"].to_numpy(dtype=float)
+    p_lon_deg = seaports["Longitude"].to_numpy(dtype=float)
+    
+    # Facility attributes as plain arrays, indexed by candidate position
+    def _obj_col(df: pd.DataFrame, name: str) -> np.ndarray:
+        if name not in df.columns:
+            return np.full(len(df), None, dtype=object)
+        return df[name].to_numpy(dtype=object)
+    
+    a_name = _obj_col(airports, "Airport Name")
+    a_iata = _obj_col(airports, "IATA")
+    a_icao = _obj_col(airports, "ICAO")
+    p_name = _obj_col(seaports, "Seaport Name")
+    
+    # Facility coordinates in radians (and their cosines), computed once per batch
+    a_lat = np.radians(a_lat_deg)
+    a_lon = np.radians(a_lon_deg)
+    a_cos = np.cos(a_lat)
+    p_lat = np.radians(p_lat_deg)
+    p_lon = np.radians(p_lon_deg)
+    p_cos = np.cos(p_lat)
+    
+    # NUTS regions for every site in one bulk query per level
+    nuts2_all: List[Dict[str, Any]] = [{}] * len(sites)
+    nuts3_all: List[Dict[str, Any]] = [{}] * len(sites)
+    if enrich_nuts3 and _HAS_SHAPELY:
+        try:
+            nuts2_all = nuts_lookup_bulk(sites["Latitude"], sites["Longitude"], level=2)
+        except Exception:
+            pass
+        try:
+            nuts3_all = nuts_lookup_bulk(sites["Latitude"], sites["Longitude"], level=3)
+        except Exception:
+            pass
+    
+    # Official admin units for every site, one bulk tree query per level
+    admin_all: Dict[str, List[Dict[str, Any]]] = {}
+    auto = st.session_state.get("official_admin", {})
+    for level in ("woj", "powiat", "gmina"):
+        if auto.get(level):
+            try:
+                admin_all[level] = auto[level].lookup_many(sites["Latitude"], sites["Longitude"])
+            except Exception:
+                pass
     
     route_cache = st.session_state.get("route_cache", {})
-    results = []
+    
+    # "Pause after N calls" as a token bucket shared by every API-calling thread:
+    # bursts of N calls, refilled at N calls per pause duration
+    limiter = RateLimiter(pause_every / pause_secs, burst=pause_every) if (pause_every and pause_secs) else None
+    
     logs = []
     api_calls = 0
     total = len(sites)
+    calls_lock = threading.Lock()
+    
+    def _throttle():
+        nonlocal api_calls
+        with calls_lock:
+            api_calls += 1
+        if limiter:
+            limiter.acquire()
+    
+    # Highway access points are found in the background, batched into union Overpass
+    # queries, overlapping with the first routing round; they are routed in the second
+    hw_pool = None
+    hw_future = None
+    if include_highway:
+        hw_pool = ThreadPoolExecutor(max_workers=1)
+        hw_future = hw_pool.submit(find_nearest_highway_access_many,
+                                   [float(la) for la in sites["Latitude"]],
+                                   [float(lo) for lo in sites["Longitude"]],
+                                   radius_km=50, throttle=_throttle)
+    
+    # OSM reverse geocoding for sites without an official admin unit, one lookup
+    # per rounded coordinate, resolved in the background alongside routing
+    rev_pool = None
+    rev_futures: Dict[Tuple[float, float], Any] = {}
+    if enrich_osm_admin:
+        for i, (la, lo) in enumerate(zip(sites["Latitude"], sites["Longitude"])):
+            if any(admin_all.get(level) and admin_all[level][i] for level in ("woj", "powiat", "gmina")):
+                continue
+            try:
+                key = (round(float(la), OSM_REVERSE_DECIMALS), round(float(lo), OSM_REVERSE_DECIMALS))
+            except (TypeError, ValueError):
+                continue
+            if key not in rev_futures:
+                if rev_pool is None:
+                    rev_pool = ThreadPoolExecutor(max_workers=OSM_REVERSE_WORKERS)
+                rev_futures[key] = rev_pool.submit(osm_reverse, *key)
+    
+    # Phase 1: top-N airport/seaport candidates by straight-line distance and the
+    # nearest city, which together give every destination each site is routed to
+    site_lats = sites["Latitude"].to_numpy(dtype=np.float64)
+    site_lons = sites["Longitude"].to_numpy(dtype=np.float64)
+    
+    # Nearest city (100k+ population) for every site in one vectorized pass
+    cities_all: List[Optional[Dict[str, Any]]] = [None] * total
+    cities_err = None
+    if _HAS_CITIES_DB:
+        try:
+            cities_all = get_nearest_cities_bulk(site_lats, site_lons, max_distance=200)
+        except Exception as e:
+            cities_err = str(e)
     
-    for idx, row in sites.iterrows():
-        project_id = str(row.get("Project ID", "")).strip()
-        site_id = str(row.get("Site ID", "")).strip()
-        site_name = str(row["Site Name"]).strip()
-        slat = float(row["Latitude"])
-        slon = float(row["Longitude"])
-        site_origin = (slat, slon)
+    # Large facility tables: top-N for all sites from a BallTree query
+    tree_a = facility_topn_bulk(np.radians(site_lats), np.radians(site_lons), a_lat, a_lon, topn)
+    tree_p = facility_topn_bulk(np.radians(site_lats), np.radians(site_lons), p_lat, p_lon, topn)
+    
+    plans: List[Dict[str, Any]] = []
+    for i, (slat, slon) in enumerate(zip(site_lats, site_lons)):
+        plan: Dict[str, Any] = {"steps": [], "city": None, "a_dests": [], "p_dests": [], "extra_dests": []}
+        plans.append(plan)
+        try:
+            slat_rad, slon_rad = math.radians(slat), math.radians(slon)
+            cos_slat = math.cos(slat_rad)
+            if tree_a is not None:
+                plan["idxs_a"], plan["a_bound"] = tree_a[0][i], tree_a[1][i]
+            else:
+                dists_a = haversine_km_pre(slat_rad, slon_rad, cos_slat, a_lat, a_lon, a_cos)
+                plan["idxs_a"] = topn_idx(dists_a, topn)
+                plan["a_bound"] = dists_a[plan["idxs_a"]]
+            if tree_p is not None:
+                plan["idxs_p"], plan["p_bound"] = tree_p[0][i], tree_p[1][i]
+            else:
+                dists_p = haversine_km_pre(slat_rad, slon_rad, cos_slat, p_lat, p_lon, p_cos)
+                plan["idxs_p"] = topn_idx(dists_p, topn)
+                plan["p_bound"] = dists_p[plan["idxs_p"]]
+            
+            if _HAS_CITIES_DB:
+                city_info = cities_all[i]
+                if cities_err:
+                    plan["steps"].append({"error": f"Nearest City lookup: {cities_err}"})
+                elif city_info is not None and city_info.get("name"):
+                    plan["city"] = city_info
+                else:
+                    plan["steps"].append({"msg": "No nearby city found within 200km"})
+            
+            plan["a_dests"] = [(float(a_lat_deg[j]), float(a_lon_deg[j])) for j in plan["idxs_a"]]
+            plan["p_dests"] = [(float(p_lat_deg[j]), float(p_lon_deg[j])) for j in plan["idxs_p"]]
+            extra = []
+            if include_ref:
+                extra.append((ref_lat, ref_lon))
+            if plan["city"] is not None:
+                extra.append((float(plan["city"].get("lat")), float(plan["city"].get("lon"))))
+            plan["extra_dests"] = extra
+        except Exception as e:
+            plan["fatal"] = str(e)
+    
+    # Phase 2: route all sites together in shared OSRM /table requests
+    origins = [(float(la), float(lo)) for la, lo in zip(sites["Latitude"], sites["Longitude"])]
+    route_kw = dict(route_cache=route_cache, throttle=_throttle)
+    
+    # Widgets can only be updated from this thread, so network progress is reported
+    # per finished /table block rather than from the API-calling threads
+    pause_note = f", pausing {pause_secs}s every {pause_every} calls" if limiter else ""
+    
+    def _round_progress(round_no: int):
+        def _hook(done: int, n: int):
+            if progress_hook:
+                progress_hook(f"Routing {done}/{n} (OSRM requests, round {round_no} of 2{pause_note})")
+        return _hook
+    
+    # Round 1: the straight-line nearest airport and seaport, plus reference and city
+    first = get_routes_many(
+        [(o, plan["a_dests"][:1] + plan["p_dests"][:1] + plan["extra_dests"]) for o, plan in zip(origins, plans)],
+        progress=_round_progress(1), **route_kw,
+    )
+    
+    # Round 2: road distance is never shorter than the straight line, so only the
+    # candidates closer as the crow flies than the best road distance so far can win
+    more = []
+    for plan, r1 in zip(plans, first):
+        na, np_ = min(1, len(plan["a_dests"])), min(1, len(plan["p_dests"]))
+        best_a = r1[0][0] if na and isinstance(r1[0], tuple) else math.inf
+        best_p = r1[na][0] if np_ and isinstance(r1[na], tuple) else math.inf
+        more_a = [k for k in range(1, len(plan["a_dests"])) if plan["a_bound"][k] < best_a]
+        more_p = [k for k in range(1, len(plan["p_dests"])) if plan["p_bound"][k] < best_p]
+        more.append((na, np_, more_a, more_p))
+    
+    # Highway access points join the second round as one more destination per site
+    hw_access: List[Dict[str, Any]] = [{} for _ in range(total)]
+    hw_err = None
+    if hw_future is not None:
+        if progress_hook and not hw_future.done():
+            progress_hook("Finding highway access points...")
+        try:
+            hw_access = hw_future.result()
+        except Exception as e:
+            hw_err = str(e)
+    hw_dests = [[(float(acc["lat"]), float(acc["lon"]))] if acc and acc.get("lat") else [] for acc in hw_access]
+    
+    second = get_routes_many(
+        [(o, [plan["a_dests"][k] for k in m[2]] + [plan["p_dests"][k] for k in m[3]] + hw)
+         for o, plan, m, hw in zip(origins, plans, more, hw_dests)],
+        progress=_round_progress(2), **route_kw,
+    )
+    
+    # Per site: airport routes, seaport routes, then reference/city; None marks a pruned candidate
+    site_routes = []
+    hw_results = []
+    for plan, r1, r2, (na, np_, more_a, more_p), acc, hw in zip(plans, first, second, more, hw_access, hw_dests):
+        air: List[Any] = [None] * len(plan["a_dests"])
+        port: List[Any] = [None] * len(plan["p_dests"])
+        if na:
+            air[0] = r1[0]
+        if np_:
+            port[0] = r1[na]
+        for n, k in enumerate(more_a):
+            air[k] = r2[n]
+        for n, k in enumerate(more_p):
+            port[k] = r2[len(more_a) + n]
+        site_routes.append(air + port + r1[na + np_:])
+        hw_results.append(_highway_result(acc, r2[-1] if hw else None))
+    
+    # Phase 3: assemble each site's record, reading plain column arrays
+    def _str_col(name: str) -> np.ndarray:
+        if name not in sites.columns:
+            return np.full(total, "", dtype=object)
+        col = np.empty(total, dtype=object)
+        col[:] = [str(v).strip() for v in sites[name].tolist()]
+        return col
+    
+    project_ids = _str_col("Project ID")
+    site_ids = _str_col("Site ID")
+    site_names = _str_col("Site Name")
+    
+    # Output columns, preallocated and filled in place per site
+    r_km = int(catchment_radius)
+    columns = ["Project ID", "Site ID", "Site Name", "Latitude", "Longitude",
+               "Nearest Airport", "Nearest Airport Code", "Distance to Airport (km)", "Time to Airport (min)",
+               "Nearest Seaport", "Distance to Seaport (km)", "Time to Seaport (min)",
+               "Nearest Highway Access", "Distance to Highway (km)", "Time to Highway (min)",
+               "Municipality", "Municipality Code", "County", "County Code", "Voivodeship", "Voivodeship Code",
+               "NUTS2 Code", "NUTS2 Name", "NUTS3 Code", "NUTS3 Name"]
+    if include_catchment:
+        columns += [f"Catchment Population ({r_km}km)", f"Catchment Unemployed ({r_km}km)",
+                    f"Catchment Active Pop ({r_km}km)", f"Catchment Employed ({r_km}km)", "Catchment NUTS3 Regions"]
+    if include_ref:
+        columns += [f"Distance to {ref_name} (km)", f"Time to {ref_name} (min)"]
+    columns += ["Nearest City (100k+)", "City Population", "Distance to City (km)", "Time to City (min)"]
+    # Distances/times are rounded to 0.1 once, at the end
+    route_cols = [c for c in columns if c.startswith(("Distance to", "Time to"))]
+    count_cols = [c for c in columns if c == "City Population"
+                  or (c.startswith("Catchment") and c != "Catchment NUTS3 Regions")]
+    text_cols = [c for c in columns if c not in route_cols and c not in count_cols
+                 and c not in ("Latitude", "Longitude")]
+    out = {c: np.full(total, None, dtype=object) for c in columns}
+    for c in route_cols:
+        out[c] = np.full(total, np.nan)
+    out["Project ID"] = project_ids
+    out["Site ID"] = site_ids
+    out["Site Name"] = site_names
+    out["Latitude"] = np.round(site_lats, 6)
+    out["Longitude"] = np.round(site_lons, 6)
+    
+    for idx in range(total):
+        site_name = site_names[idx]
+        slat = float(site_lats[idx])
+        slon = float(site_lons[idx])
         
         log_rec = {"site": site_name, "steps": []}
-        out_rec = {
-            "Project ID": project_id,
-            "Site ID": site_id,
-            "Site Name": site_name,
-            "Latitude": round(slat, 6),
-            "Longitude": round(slon, 6),
-            "Nearest Airport": None,
-            "Nearest Airport Code": None,
-            "Distance to Airport (km)": None,
-            "Time to Airport (min)": None,
-            "Nearest Seaport": None,
-            "Distance to Seaport (km)": None,
-            "Time to Seaport (min)": None,
-            "Nearest Highway Access": None,
-            "Distance to Highway (km)": None,
-            "Time to Highway (min)": None,
-            "Municipality": None,
-            "Municipality Code": None,
-            "County": None,
-            "County Code": None,
-            "Voivodeship": None,
-            "Voivodeship Code": None,
-            "NUTS2 Code": None,
-            "NUTS2 Name": None,
-            "NUTS3 Code": None,
-            "NUTS3 Name": None,
-        }
-        
-        # Add catchment fields
-        if include_catchment:
-            out_rec[f"Catchment Population ({int(catchment_radius)}km)"] = None
-            out_rec[f"Catchment Unemployed ({int(catchment_radius)}km)"] = None
-            out_rec[f"Catchment Active Pop ({int(catchment_radius)}km)"] = None
-            out_rec[f"Catchment Employed ({int(catchment_radius)}km)"] = None
-            out_rec["Catchment NUTS3 Regions"] = None
-        
-        if include_ref:
-            out_rec[f"Distance to {ref_name} (km)"] = None
-            out_rec[f"Time to {ref_name} (min)"] = None
-        
-        # Add nearest city (100k+) fields
-        out_rec["Nearest City (100k+)"] = None
-        out_rec["City Population"] = None
-        out_rec["Distance to City (km)"] = None
-        out_rec["Time to City (min)"] = None
         
         try:
-            # Find nearest airport
-            dists_a = haversine_km(slat, slon, a_lat, a_lon)
-            idxs_a = np.argsort(dists_a)[:min(topn, len(airports))]
-            cand_airports = airports.iloc[idxs_a].copy()
+            plan = plans[idx]
+            log_rec["steps"].extend(plan["steps"])
+            if "fatal" in plan:
+                raise RuntimeError(plan["fatal"])
+            idxs_a = plan["idxs_a"]
+            idxs_p = plan["idxs_p"]
             
+            city_info = plan["city"]
+            if city_info is not None:
+                city_pop = city_info.get("pop", 0)
+                out["Nearest City (100k+)"][idx] = city_info.get("name")
+                out["City Population"][idx] = int(city_pop) if city_pop else None
+            
+            routes = site_routes[idx]
+            air_routes = routes[:len(idxs_a)]
+            port_routes = routes[len(idxs_a):len(idxs_a) + len(idxs_p)]
+            extra_routes = routes[len(idxs_a) + len(idxs_p):]
+            
+            # Find nearest airport
             best_air, best_air_d, best_air_t = None, math.inf, math.inf
-            for _, a in cand_airports.iterrows():
-                dest = (float(a["Latitude"]), float(a["Longitude"]))
-                try:
-                    if api_calls and pause_every and api_calls % pause_every == 0:
-                        if progress_hook:
-                            progress_hook(f"Pausing {pause_secs}s...")
-                        time.sleep(pause_secs)
-                    dist_km, dur_min = get_route(site_origin, dest, route_cache=route_cache)
-                    api_calls += 1
-                    if dist_km < best_air_d:
-                        best_air, best_air_d, best_air_t = a, dist_km, dur_min
-                except Exception as e:
-                    log_rec["steps"].append({"error": f"Airport '{a['Airport Name']}': {e}"})
+            for j, res in zip(idxs_a, air_routes):
+                if res is None:
+                    continue
+                if isinstance(res, Exception):
+                    log_rec["steps"].append({"error": f"Airport '{a_name[j]}': {res}"})
+                    continue
+                dist_km, dur_min = res
+                if dist_km < best_air_d:
+                    best_air, best_air_d, best_air_t = j, dist_km, dur_min
             
             if best_air is not None:
-                out_rec["Nearest Airport"] = str(best_air.get("Airport Name"))
-                out_rec["Nearest Airport Code"] = str(best_air.get("IATA") or best_air.get("ICAO") or "")
-                out_rec["Distance to Airport (km)"] = round(best_air_d, 1)
-                out_rec["Time to Airport (min)"] = round(best_air_t, 1)
+                out["Nearest Airport"][idx] = str(a_name[best_air])
+                out["Nearest Airport Code"][idx] = str(a_iata[best_air] or a_icao[best_air] or "")
+                out["Distance to Airport (km)"][idx] = best_air_d
+                out["Time to Airport (min)"][idx] = best_air_t
             
             # Find nearest seaport
-            dists_p = haversine_km(slat, slon, p_lat, p_lon)
-            idxs_p = np.argsort(dists_p)[:min(topn, len(seaports))]
-            cand_ports = seaports.iloc[idxs_p].copy()
-            
             best_port, best_port_d, best_port_t = None, math.inf, math.inf
-            for _, p in cand_ports.iterrows():
-                dest = (float(p["Latitude"]), float(p["Longitude"]))
-                try:
-                    if api_calls and pause_every and api_calls % pause_every == 0:
-                        if progress_hook:
-                            progress_hook(f"Pausing {pause_secs}s...")
-                        time.sleep(pause_secs)
-                    dist_km, dur_min = get_route(site_origin, dest, route_cache=route_cache)
-                    api_calls += 1
-                    if dist_km < best_port_d:
-                        best_port, best_port_d, best_port_t = p, dist_km, dur_min
-                except Exception as e:
-                    log_rec["steps"].append({"error": f"Seaport '{p['Seaport Name']}': {e}"})
+            for j, res in zip(idxs_p, port_routes):
+                if res is None:
+                    continue
+                if isinstance(res, Exception):
+                    log_rec["steps"].append({"error": f"Seaport '{p_name[j]}': {res}"})
+                    continue
+                dist_km, dur_min = res
+                if dist_km < best_port_d:
+                    best_port, best_port_d, best_port_t = j, dist_km, dur_min
             
             if best_port is not None:
-                out_rec["Nearest Seaport"] = str(best_port.get("Seaport Name"))
-                out_rec["Distance to Seaport (km)"] = round(best_port_d, 1)
-                out_rec["Time to Seaport (min)"] = round(best_port_t, 1)
+                out["Nearest Seaport"][idx] = str(p_name[best_port])
+                out["Distance to Seaport (km)"][idx] = best_port_d
+                out["Time to Seaport (min)"][idx] = best_port_t
             
             # Highway distance
             if include_highway:
                 try:
-                    if api_calls and pause_every and api_calls % pause_every == 0:
-                        if progress_hook:
-                            progress_hook(f"Pausing {pause_secs}s...")
-                        time.sleep(pause_secs)
-                    
-                    highway_dist, highway_time, highway_name = get_highway_distance(slat, slon, route_cache=route_cache, progress_hook=progress_hook)
-                    api_calls += 1
+                    if hw_err:
+                        raise RuntimeError(hw_err)
+                    highway_dist, highway_time, highway_name = hw_results[idx]
                     
                     if highway_dist is not None and highway_name:
-                        out_rec["Nearest Highway Access"] = highway_name
-                        out_rec["Distance to Highway (km)"] = round(highway_dist, 1)
+                        out["Nearest Highway Access"][idx] = highway_name
+                        out["Distance to Highway (km)"][idx] = highway_dist
                         if highway_time is not None:
-                            out_rec["Time to Highway (min)"] = round(highway_time, 1)
+                            out["Time to Highway (min)"][idx] = highway_time
                         log_rec["steps"].append({"msg": f"Highway: {highway_name}, {highway_dist:.1f} km away"})
                     else:
                         log_rec["steps"].append({"msg": "No highway access found within 50km"})
@@ -1138,71 +2051,40 @@ def process_batch(
             
             # Reference distance
             if include_ref:
-                try:
-                    if api_calls and pause_every and api_calls % pause_every == 0:
-                        if progress_hook:
-                            progress_hook(f"Pausing {pause_secs}s...")
-                        time.sleep(pause_secs)
-                    dist_km, dur_min = get_route(site_origin, (ref_lat, ref_lon), route_cache=route_cache)
-                    api_calls += 1
-                    out_rec[f"Distance to {ref_name} (km)"] = round(dist_km, 1)
-                    out_rec[f"Time to {ref_name} (min)"] = round(dur_min, 1)
-                except Exception as e:
-                    log_rec["steps"].append({"error": f"Reference: {e}"})
+                res = extra_routes.pop(0)
+                if isinstance(res, Exception):
+                    log_rec["steps"].append({"error": f"Reference: {res}"})
+                else:
+                    dist_km, dur_min = res
+                    out[f"Distance to {ref_name} (km)"][idx] = dist_km
+                    out[f"Time to {ref_name} (min)"][idx] = dur_min
             
-            # Nearest city (100k+ population)
-            if _HAS_CITIES_DB:
-                try:
-                    city_info = get_nearest_city(slat, slon, max_distance=200)
-                    if city_info is not None and city_info.get("name"):
-                        city_name = city_info.get("name")
-                        city_pop = city_info.get("pop", 0)
-                        city_lat = float(city_info.get("lat"))
-                        city_lon = float(city_info.get("lon"))
-                        
-                        out_rec["Nearest City (100k+)"] = city_name
-                        out_rec["City Population"] = int(city_pop) if city_pop else None
-                        
-                        try:
-                            # Calculate route distance to city
-                            if api_calls and pause_every and api_calls % pause_every == 0:
-                                if progress_hook:
-                                    progress_hook(f"Pausing {pause_secs}s...")
-                                time.sleep(pause_secs)
-                            
-                            dist_km, dur_min = get_route(site_origin, (city_lat, city_lon), route_cache=route_cache)
-                            api_calls += 1
-                            
-                            out_rec["Distance to City (km)"] = round(dist_km, 1)
-                            out_rec["Time to City (min)"] = round(dur_min, 1)
-                            
-                            # Format log message safely
-                            pop_str = f"{int(city_pop):,}" if city_pop else "unknown"
-                            log_rec["steps"].append({"msg": f"Nearest city: {city_name} ({pop_str} pop), {dist_km:.1f} km, {dur_min:.0f} min"})
-                        except Exception as route_err:
-                            log_rec["steps"].append({"error": f"Route to {city_name}: {str(route_err)}"})
-                    else:
-                        log_rec["steps"].append({"msg": "No nearby city found within 200km"})
-                except Exception as e:
-                    log_rec["steps"].append({"error": f"Nearest City lookup: {str(e)}"})
+            # Route to nearest city
+            if city_info is not None:
+                city_name = city_info.get("name")
+                city_pop = city_info.get("pop", 0)
+                res = extra_routes.pop(0)
+                if isinstance(res, Exception):
+                    log_rec["steps"].append({"error": f"Route to {city_name}: {str(res)}"})
+                else:
+                    dist_km, dur_min = res
+                    out["Distance to City (km)"][idx] = dist_km
+                    out["Time to City (min)"][idx] = dur_min
+                    
+                    # Format log message safely
+                    pop_str = f"{int(city_pop):,}" if city_pop else "unknown"
+                    log_rec["steps"].append({"msg": f"Nearest city: {city_name} ({pop_str} pop), {dist_km:.1f} km, {dur_min:.0f} min"})
             
-            # NUTS enrichment
-            if _HAS_SHAPELY:
-                try:
-                    n2 = nuts2_lookup(slat, slon)
-                    if n2:
-                        out_rec["NUTS2 Code"] = n2.get("NUTS_ID")
-                        out_rec["NUTS2 Name"] = n2.get("NAME_LATN")
-                except:
-                    pass
-                
-                try:
-                    n3 = nuts3_lookup(slat, slon)
-                    if n3:
-                        out_rec["NUTS3 Code"] = n3.get("NUTS_ID")
-                        out_rec["NUTS3 Name"] = n3.get("NAME_LATN")
-                except:
-                    pass
+            # NUTS enrichment (looked up in bulk before the loop)
+            n2 = nuts2_all[idx]
+            if n2:
+                out["NUTS2 Code"][idx] = n2.get("NUTS_ID")
+                out["NUTS2 Name"][idx] = n2.get("NAME_LATN")
+            
+            n3 = nuts3_all[idx]
+            if n3:
+                out["NUTS3 Code"][idx] = n3.get("NUTS_ID")
+                out["NUTS3 Name"][idx] = n3.get("NAME_LATN")
             
             # Catchment area
             if include_catchment:
@@ -1210,54 +2092,51 @@ def process_batch(
                     catchment = calculate_catchment_area(slat, slon, radius_km=catchment_radius)
                     
                     if catchment["total_population"] > 0:
-                        out_rec[f"Catchment Population ({int(catchment_radius)}km)"] = catchment["total_population"]
-                        out_rec[f"Catchment Unemployed ({int(catchment_radius)}km)"] = catchment["unemployed_persons"]
-                        out_rec[f"Catchment Active Pop ({int(catchment_radius)}km)"] = catchment["active_population"]
-                        out_rec[f"Catchment Employed ({int(catchment_radius)}km)"] = catchment["employed_persons"]
-                        out_rec["Catchment NUTS3 Regions"] = ", ".join(catchment["nuts3_regions"][:3])
+                        out[f"Catchment Population ({r_km}km)"][idx] = catchment["total_population"]
+                        out[f"Catchment Unemployed ({r_km}km)"][idx] = catchment["unemployed_persons"]
+                        out[f"Catchment Active Pop ({r_km}km)"][idx] = catchment["active_population"]
+                        out[f"Catchment Employed ({r_km}km)"][idx] = catchment["employed_persons"]
+                        out["Catchment NUTS3 Regions"][idx] = ", ".join(catchment["nuts3_regions"][:3])
                 except:
                     pass
             
             # Admin boundaries
             have_official = False
             try:
-                auto = st.session_state.get("official_admin", {})
-                idx_woj = auto.get("woj")
-                idx_pow = auto.get("powiat")
-                idx_gmi = auto.get("gmina")
-                
-                if idx_woj:
-                    w = idx_woj.lookup(slat, slon)
+                if admin_all.get("woj"):
+                    w = admin_all["woj"][idx]
                     if w:
-                        out_rec["Voivodeship"] = w.get("name")
-                        out_rec["Voivodeship Code"] = w.get("code")
+                        out["Voivodeship"][idx] = w.get("name")
+                        out["Voivodeship Code"][idx] = w.get("code")
                         have_official = True
                 
-                if idx_pow:
-                    p = idx_pow.lookup(slat, slon)
+                if admin_all.get("powiat"):
+                    p = admin_all["powiat"][idx]
                     if p:
-                        out_rec["County"] = p.get("name")
-                        out_rec["County Code"] = p.get("code")
+                        out["County"][idx] = p.get("name")
+                        out["County Code"][idx] = p.get("code")
                         have_official = True
                 
-                if idx_gmi:
-                    g = idx_gmi.lookup(slat, slon)
+                if admin_all.get("gmina"):
+                    g = admin_all["gmina"][idx]
                     if g:
-                        out_rec["Municipality"] = g.get("name")
-                        out_rec["Municipality Code"] = g.get("code")
+                        out["Municipality"][idx] = g.get("name")
+                        out["Municipality Code"][idx] = g.get("code")
                         have_official = True
             except:
                 pass
             
             if enrich_osm_admin and not have_official:
                 try:
-                    adm = osm_reverse(slat, slon)
-                    out_rec["Municipality"] = adm.get("municipality") or out_rec.get("Municipality")
-                    out_rec["Municipality Code"] = adm.get("municipality_code") or out_rec.get("Municipality Code")
-                    out_rec["County"] = adm.get("county") or out_rec.get("County")
-                    out_rec["County Code"] = adm.get("county_code") or out_rec.get("County Code")
-                    out_rec["Voivodeship"] = adm.get("voivodeship") or out_rec.get("Voivodeship")
-                    out_rec["Voivodeship Code"] = adm.get("voivodeship_code") or out_rec.get("Voivodeship Code")
+                    key = (round(slat, OSM_REVERSE_DECIMALS), round(slon, OSM_REVERSE_DECIMALS))
+                    fut = rev_futures.get(key)
+                    adm = fut.result() if fut is not None else osm_reverse(*key)
+                    out["Municipality"][idx] = adm.get("municipality") or out["Municipality"][idx]
+                    out["Municipality Code"][idx] = adm.get("municipality_code") or out["Municipality Code"][idx]
+                    out["County"][idx] = adm.get("county") or out["County"][idx]
+                    out["County Code"][idx] = adm.get("county_code") or out["County Code"][idx]
+                    out["Voivodeship"][idx] = adm.get("voivodeship") or out["Voivodeship"][idx]
+                    out["Voivodeship Code"][idx] = adm.get("voivodeship_code") or out["Voivodeship Code"][idx]
                 except:
                     pass
         
@@ -1265,13 +2144,23 @@ def process_batch(
             log_rec["steps"].append({"fatal": str(e)})
         
         logs.append(log_rec)
-        results.append(out_rec)
         
         if progress_hook:
-            progress_hook(f"Processed {len(results)}/{total}")
+            progress_hook(f"Processed {idx + 1}/{total}")
     
+    if hw_pool is not None:
+        hw_pool.shutdown(wait=False, cancel_futures=True)
+    if rev_pool is not None:
+        rev_pool.shutdown(wait=False, cancel_futures=True)
     st.session_state["route_cache"] = route_cache
-    df_res = pd.DataFrame(results)
+    for c in route_cols:
+        out[c] = np.round(out[c], 1)
+    # Explicit dtypes, so a column no site filled in (all None) is typed like its siblings
+    df_res = pd.DataFrame(out)
+    for c in text_cols:
+        df_res[c] = pd.Series(out[c], dtype=str)
+    for c in count_cols:
+        df_res[c] = pd.to_numeric(df_res[c])
     return df_res, logs, api_calls
 
 # ---------------------- UI Components ----------------------
@@ -1421,6 +2310,11 @@ def upload_area() -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
     sites_df = airports_df = seaports_df = None
 
     def _read_xlsx(up: UploadedFile, sheet: str) -> pd.DataFrame:
+        if _HAS_CALAMINE:
+            try:
+                return pd.read_excel(up, engine="calamine", sheet_name=sheet)
+            except Exception:
+                up.seek(0)
         return pd.read_excel(up, engine="openpyxl", sheet_name=sheet)
 
     if sites_file is not None:
@@ -1461,6 +2355,31 @@ def upload_area() -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
 
     return sites_df, airports_df, seaports_df
 
+@st.cache_resource(show_spinner=False)
+def _xlsx_pool() -> ThreadPoolExecutor:
+    """Background workers that serialize the xlsx exports while results render"""
+    return ThreadPoolExecutor(max_workers=2)
+
+def _take_xlsx(key: str, wait: bool = False) -> Optional[bytes]:
+    """Collect a background xlsx build into session_state once it is finished (or when waiting)"""
+    fut = st.session_state.get(key + "_future")
+    if fut is not None and (wait or fut.done()):
+        st.session_state.pop(key + "_future", None)
+        try:
+            st.session_state[key + "_bytes"] = fut.result()
+        except Exception:
+            pass
+    return st.session_state.get(key + "_bytes")
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _build_xlsx(df: pd.DataFrame, sheet_name: str) -> bytes:
+    return _df_to_xlsx_bytes(df, sheet_name)
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _build_site_selection_xlsx(df: pd.DataFrame, ref_name: Optional[str], catchment_radius: int) -> bytes:
+    df_long = create_site_selection_format(df, ref_name=ref_name, catchment_radius=catchment_radius)
+    return _df_to_xlsx_bytes(df_long, "SiteSelection")
+
 def results_downloads(df: pd.DataFrame, ref_name: str = None, catchment_radius: int = 50, 
                      filename_prefix: str = "results"):
     """Download section with multiple export formats"""
@@ -1475,26 +2394,50 @@ def results_downloads(df: pd.DataFrame, ref_name: str = None, catchment_radius:
                           file_name=f"{filename_prefix}.csv",
                           use_container_width=True)
     
-    # Excel export
+    # Excel export (built in the background after a run, or on demand)
     with col2:
-        bio = io.BytesIO()
-        with pd.ExcelWriter(bio, engine="xlsxwriter") as xw:
-            df.to_excel(xw, index=False, sheet_name="Results")
-        st.download_button("📊 Excel Format", data=bio.getvalue(), 
-                          file_name=f"{filename_prefix}.xlsx",
-                          use_container_width=True)
-    
-    # Site Selection Tool format
+        xlsx_bytes = _take_xlsx("xlsx_results")
+        if xlsx_bytes is None and st.button("📊 Prepare Excel", use_container_width=True):
+            xlsx_bytes = _take_xlsx("xlsx_results", wait=True)
+            if xlsx_bytes is None:
+                xlsx_bytes = st.session_state["xlsx_results_bytes"] = _build_xlsx(df, "Results")
+        if xlsx_bytes is not None:
+            st.download_button("📊 Excel Format", data=xlsx_bytes, 
+                              file_name=f"{filename_prefix}.xlsx",
+                              use_container_width=True)
+    
+    # Site Selection Tool format (reshape only runs when requested)
     with col3:
-        df_long = create_site_selection_format(df, ref_name=ref_name, catchment_radius=catchment_radius)
-        bio_long = io.BytesIO()
-        with pd.ExcelWriter(bio_long, engine="xlsxwriter") as xw:
-            df_long.to_excel(xw, index=False, sheet_name="SiteSelection")
-        st.download_button("🎯 Site Selection Format", 
-                          data=bio_long.getvalue(),
-                          file_name=f"{filename_prefix}_site_selection.xlsx",
-                          help="Long format with one row per site-destination pair",
-                          use_container_width=True)
+        sel_key = (ref_name, catchment_radius)
+        if st.session_state.get("xlsx_selection_key") != sel_key:
+            st.session_state.pop("xlsx_selection_bytes", None)
+            st.session_state.pop("xlsx_selection_future", None)
+        sel_bytes = _take_xlsx("xlsx_selection")
+        if sel_bytes is None and st.button("🎯 Prepare Site Selection", use_container_width=True,
+                                           help="Long format with one row per site-destination pair"):
+            sel_bytes = _take_xlsx("xlsx_selection", wait=True)
+            if sel_bytes is None:
+                sel_bytes = _build_site_selection_xlsx(df, ref_name, catchment_radius)
+                st.session_state["xlsx_selection_bytes"] = sel_bytes
+                st.session_state["xlsx_selection_key"] = sel_key
+        if sel_bytes is not None:
+            st.download_button("🎯 Site Selection Format", 
+                              data=sel_bytes,
+                              file_name=f"{filename_prefix}_site_selection.xlsx",
+                              help="Long format with one row per site-destination pair",
+                              use_container_width=True)
+
+def _log_markdown(logs: List[Dict[str, Any]]) -> str:
+    """Processing log as one markdown blob (a single element instead of one per step)"""
+    lines = []
+    for rec in logs:
+        lines.append(f"\n**{rec['site']}**\n")
+        for step in rec.get("steps", []):
+            if "msg" in step:
+                lines.append(f"- {step['msg']}")
+            if "error" in step:
+                lines.append(f"- ❌ {step['error']}")
+    return "\n".join(lines)
 
 def display_catchment_summary(df: pd.DataFrame, catchment_radius: int):
     """Display catchment area summary statistics"""
@@ -1531,42 +2474,43 @@ def display_catchment_summary(df: pd.DataFrame, catchment_radius: int):
         # Create ranking table
         st.subheader("📊 Site Rankings by Labor Market Potential")
         
-        summary_data = []
-        for _, row in df.iterrows():
-            if pop_col in row:
-                summary_data.append({
-                    "Site": row["Site Name"],
-                    "Population": row.get(pop_col, 0),
-                    "Unemployed": row.get(unemployed_col, 0),
-                    "Active Pop": row.get(active_col, 0),
-                    "Score": 0
-                })
+        # Column projection instead of a per-row dict loop
+        summary_df = pd.DataFrame({
+            "Site": df["Site Name"].to_numpy(),
+            "Population": df[pop_col].to_numpy(),
+            "Unemployed": df[unemployed_col].to_numpy() if unemployed_col in df.columns else 0,
+            "Active Pop": df[active_col].to_numpy() if active_col in df.columns else 0,
+            "Score": 0,
+        })
         
-        if summary_data:
-            summary_df = pd.DataFrame(summary_data)
-            
+        if not summary_df.empty:
             # Calculate score
-            if summary_df["Population"].max() > 0:
-                max_pop = summary_df["Population"].max()
-                max_unemployed = summary_df["Unemployed"].max() if summary_df["Unemployed"].max() > 0 else 1
+            max_pop = summary_df["Population"].max()
+            if max_pop > 0:
+                max_unemployed = summary_df["Unemployed"].max()
+                if not max_unemployed > 0:
+                    max_unemployed = 1
                 
                 summary_df["Score"] = (
-                    (summary_df["Population"] / max_pop) * 60 +
-                    (summary_df["Unemployed"] / max_unemployed) * 40
-                )
-                summary_df["Score"] = summary_df["Score"].round(1)
-                summary_df = summary_df.sort_values("Score", ascending=False)
+                    summary_df["Population"].to_numpy() / max_pop * 60 +
+                    summary_df["Unemployed"].to_numpy() / max_unemployed * 40
+                ).round(1)
+                summary_df = summary_df.sort_values("Score", ascending=False, kind="stable")
                 
                 st.dataframe(summary_df, use_container_width=True, hide_index=True)
 
-def maybe_map(df: pd.DataFrame, airports: pd.DataFrame, seaports: pd.DataFrame):
-    """Create interactive map with all locations"""
-    if not _HAS_MAP:
-        st.info("Map preview requires folium and streamlit-folium packages")
-        return
-    
-    if df is None or df.empty:
-        return
+@st.cache_data(show_spinner=False, max_entries=4)
+def _build_map_html(df: pd.DataFrame, airports: pd.DataFrame, seaports: pd.DataFrame,
+                    ref_lat: Any, ref_lon: Any, ref_name: Optional[str]) -> str:
+    """Render the folium map for one result set to standalone HTML"""
+    # Name -> coordinates lookups (first row per name wins, as with a filtered .iloc[0])
+    def _coords_by_name(fac, name_col):
+        if fac is None or fac.empty:
+            return {}
+        return (fac.drop_duplicates(name_col).set_index(name_col)[["Latitude", "Longitude"]]
+                .astype("float64").to_dict("index"))
+    airport_coords = _coords_by_name(airports, "Airport Name")
+    seaport_coords = _coords_by_name(seaports, "Seaport Name")
     
     mean_lat = float(df["Latitude"].mean())
     mean_lon = float(df["Longitude"].mean())
@@ -1583,63 +2527,79 @@ def maybe_map(df: pd.DataFrame, airports: pd.DataFrame, seaports: pd.DataFrame):
     airport_group = folium.FeatureGroup(name="Airports", show=True)
     seaport_group = folium.FeatureGroup(name="Seaports", show=True)
     
-    # Add sites
-    for _, r in df.iterrows():
+    # Add sites (one records conversion instead of per-row Series access)
+    site_cols = {"Site Name": None, "Project ID": "", "Site ID": "",
+                 "Distance to Airport (km)": "N/A", "Distance to Seaport (km)": "N/A",
+                 "Distance to Highway (km)": "N/A", "Nearest Airport": None, "Nearest Seaport": None}
+    view = df.reindex(columns=list(site_cols))
+    for c, default in site_cols.items():
+        if c not in df.columns:
+            view[c] = default
+    records = view.to_dict("records")
+    popup_fmt = SITE_POPUP_TEMPLATE.format_map
+    # Coordinates cast once here rather than float() per marker
+    lats = df["Latitude"].astype("float64").tolist()
+    lons = df["Longitude"].astype("float64").tolist()
+    cluster = len(df) >= MAP_CLUSTER_MIN_SITES
+    cluster_rows = []
+    # Unique nearest airports/seaports collected in the same pass (dicts keep first-seen order)
+    airport_seen: Dict[str, None] = {}
+    seaport_seen: Dict[str, None] = {}
+    for lat, lon, r in zip(lats, lons, records):
+        name = r["Site Name"]
+        an = r["Nearest Airport"]
+        pn = r["Nearest Seaport"]
+        if isinstance(an, str):
+            airport_seen[an] = None
+        if isinstance(pn, str):
+            seaport_seen[pn] = None
+        popup_html = popup_fmt(r)
+        if cluster:
+            cluster_rows.append([lat, lon, str(name), popup_html])
+            continue
         folium.CircleMarker(
-            [float(r["Latitude"]), float(r["Longitude"])],
+            [lat, lon],
             radius=5,
-            popup=folium.Popup(f"""
-                <b>{r['Site Name']}</b><br>
-                Project: {r.get('Project ID', '')}<br>
-                Site ID: {r.get('Site ID', '')}<br>
-                Airport: {r.get('Distance to Airport (km)', 'N/A')} km<br>
-                Seaport: {r.get('Distance to Seaport (km)', 'N/A')} km<br>
-                Highway: {r.get('Distance to Highway (km)', 'N/A')} km
-            """, max_width=300),
-            tooltip=str(r["Site Name"]),
+            popup=folium.Popup(popup_html, max_width=300),
+            tooltip=str(name),
             fill=True,
             color='blue',
             fillColor='lightblue'
         ).add_to(site_group)
+    if cluster:
+        # One clustered layer fed from a flat array; markers are created client-side
+        FastMarkerCluster(cluster_rows, callback="""
+            function (row) {
+                var marker = L.circleMarker(new L.LatLng(row[0], row[1]),
+                    {radius: 5, fill: true, color: 'blue', fillColor: 'lightblue'});
+                marker.bindTooltip(row[2]);
+                marker.bindPopup(row[3], {maxWidth: 300});
+                return marker;
+            };""").add_to(site_group)
     
     # Add unique airports
-    added_airports = set()
-    for _, r in df.iterrows():
-        a_name = r.get("Nearest Airport")
-        if isinstance(a_name, str) and a_name not in added_airports:
-            added_airports.add(a_name)
-            arow = airports[airports["Airport Name"] == a_name]
-            if not arow.empty:
-                alat = float(arow.iloc[0]["Latitude"])
-                alon = float(arow.iloc[0]["Longitude"])
-                folium.Marker(
-                    [alat, alon],
-                    icon=folium.Icon(icon="plane", prefix="fa", color='red'),
-                    popup=f"✈️ {a_name}",
-                    tooltip=f"✈️ {a_name}"
-                ).add_to(airport_group)
+    for a_name in airport_seen:
+        coord = airport_coords.get(a_name)
+        if coord is not None:
+            folium.Marker(
+                [coord["Latitude"], coord["Longitude"]],
+                icon=folium.Icon(icon="plane", prefix="fa", color='red'),
+                popup=f"✈️ {a_name}",
+                tooltip=f"✈️ {a_name}"
+            ).add_to(airport_group)
     
     # Add unique seaports
-    added_seaports = set()
-    for _, r in df.iterrows():
-        p_name = r.get("Nearest Seaport")
-        if isinstance(p_name, str) and p_name not in added_seaports:
-            added_seaports.add(p_name)
-            prow = seaports[seaports["Seaport Name"] == p_name]
-            if not prow.empty:
-                plat = float(prow.iloc[0]["Latitude"])
-                plon = float(prow.iloc[0]["Longitude"])
-                folium.Marker(
-                    [plat, plon],
-                    icon=folium.Icon(icon="ship", prefix="fa", color='darkblue'),
-                    popup=f"🚢 {p_name}",
-                    tooltip=f"🚢 {p_name}"
-                ).add_to(seaport_group)
+    for p_name in seaport_seen:
+        coord = seaport_coords.get(p_name)
+        if coord is not None:
+            folium.Marker(
+                [coord["Latitude"], coord["Longitude"]],
+                icon=folium.Icon(icon="ship", prefix="fa", color='darkblue'),
+                popup=f"🚢 {p_name}",
+                tooltip=f"🚢 {p_name}"
+            ).add_to(seaport_group)
     
     # Add reference location
-    ref_lat = st.session_state.get("ref_lat")
-    ref_lon = st.session_state.get("ref_lon")
-    ref_name = st.session_state.get("ref_name")
     if isinstance(ref_lat, (int, float)) and isinstance(ref_lon, (int, float)):
         folium.Marker(
             [float(ref_lat), float(ref_lon)],
@@ -1656,11 +2616,26 @@ def maybe_map(df: pd.DataFrame, airports: pd.DataFrame, seaports: pd.DataFrame):
     # Add layer control
     folium.LayerControl().add_to(m)
     
-    st_folium(m, height=500, use_container_width=True)
+    return m.get_root().render()
+
+def maybe_map(df: pd.DataFrame, airports: pd.DataFrame, seaports: pd.DataFrame,
+              ref_lat: Any = None, ref_lon: Any = None, ref_name: Optional[str] = None):
+    """Create interactive map with all locations"""
+    if not _HAS_MAP:
+        st.info("Map preview requires the folium package")
+        return
+    
+    if df is None or df.empty:
+        return
+    
+    # Built once per result set/reference; reruns only re-embed the cached HTML
+    html = _build_map_html(df, airports, seaports, ref_lat, ref_lon, ref_name)
+    components.html(html, height=500)
 
 # ---------------------- Main Application ----------------------
 def main():
     st.set_page_config(page_title=APP_TITLE, layout="wide", page_icon="🗺️")
+    prefetch_nuts()
     
     st.title(APP_TITLE)
     st.caption(APP_SUBTITLE)
@@ -1688,25 +2663,31 @@ def main():
         status = st.empty()
         pbar = st.progress(0)
         
+        last_update = [0.0]
+        # Each phase fills a fixed share of the bar (start, width), so it never moves backwards
+        phase_spans = {"round 1": (0.0, 0.3), "round 2": (0.3, 0.2), "Processed": (0.5, 0.5)}
+        
         def progress_hook(msg: str):
-            if "Processed" in msg:
+            if "Processed" in msg or msg.startswith("Routing"):
                 try:
                     parts = msg.split()
                     done = int(parts[1].split("/")[0])
                     total = int(parts[1].split("/")[1])
-                    pbar.progress(min(done / max(total, 1), 1.0))
+                    # Each widget update is a websocket round-trip: at most 10/s, plus the last site
+                    now = time.monotonic()
+                    if done < total and now - last_update[0] <= 0.1:
+                        return
+                    last_update[0] = now
+                    phase = "Processed" if "Processed" in msg else ("round 2" if "round 2" in msg else "round 1")
+                    start, width = phase_spans[phase]
+                    pbar.progress(start + width * min(done / max(total, 1), 1.0))
                 except:
                     pass
             status.info(msg)
         
         try:
-            df_res, logs, api_calls = process_batch(
-                sites_df, airports_df, seaports_df,
+            process_kwargs = dict(
                 topn=int(topn),
-                include_ref=use_ref,
-                ref_lat=float(ref_lat),
-                ref_lon=float(ref_lon),
-                ref_name=ref_name,
                 pause_every=int(pause_every),
                 pause_secs=float(pause_secs),
                 progress_hook=progress_hook,
@@ -1716,15 +2697,29 @@ def main():
                 include_catchment=include_catchment,
                 catchment_radius=catchment_radius,
             )
+            # Reference arguments are only passed (and parsed) for reference runs
+            if use_ref:
+                process_kwargs.update(include_ref=True, ref_lat=float(ref_lat),
+                                      ref_lon=float(ref_lon), ref_name=ref_name)
+            df_res, logs, api_calls = process_batch(sites_df, airports_df, seaports_df, **process_kwargs)
             
             pbar.progress(1.0)
             status.success(f"✅ Analysis complete! API calls: {api_calls}, Cached: {len(st.session_state.get('route_cache', {}))}")
             
             # Store results in session
-            st.session_state["last_results"] = df_res
+            _stash_frame("last_results", df_res)
+            for k in ("xlsx_results_bytes", "xlsx_results_future",
+                      "xlsx_selection_bytes", "xlsx_selection_future", "xlsx_selection_key"):
+                st.session_state.pop(k, None)
+            # Serialize both exports off the main thread while the results render
+            sel_ref = ref_name if use_ref else None
+            st.session_state["xlsx_results_future"] = _xlsx_pool().submit(_build_xlsx, df_res, "Results")
+            st.session_state["xlsx_selection_future"] = _xlsx_pool().submit(
+                _build_site_selection_xlsx, df_res, sel_ref, int(catchment_radius))
+            st.session_state["xlsx_selection_key"] = (sel_ref, int(catchment_radius))
             st.session_state["last_logs"] = logs
-            st.session_state["last_airports"] = airports_df
-            st.session_state["last_seaports"] = seaports_df
+            _stash_frame("last_airports", airports_df)
+            _stash_frame("last_seaports", seaports_df)
             st.session_state["last_ref_name"] = ref_name if use_ref else None
             st.session_state["last_catchment_radius"] = catchment_radius
             
@@ -1743,29 +2738,26 @@ def main():
             
             # Processing log
             with st.expander("📋 Processing Log"):
-                for rec in logs:
-                    st.write(f"**{rec['site']}**")
-                    for step in rec["steps"]:
-                        if "msg" in step:
-                            st.write(f"- {step['msg']}")
-                        if "error" in step:
-                            st.error(f"- {step['error']}")
+                st.markdown(_log_markdown(logs))
             
             # Map
             if st.checkbox("🗺️ Show Interactive Map", key="show_map"):
-                maybe_map(df_res, airports_df, seaports_df)
+                ss = dict(st.session_state)
+                maybe_map(df_res, airports_df, seaports_df,
+                          ss.get("ref_lat"), ss.get("ref_lon"), ss.get("ref_name"))
         
         except Exception as e:
             st.error(f"Processing failed: {str(e)}")
             st.exception(e)
     
     # Show last results if available
-    elif st.session_state.get("last_results") is not None:
-        df_res = st.session_state["last_results"]
-        airports_df = st.session_state.get("last_airports")
-        seaports_df = st.session_state.get("last_seaports")
-        ref_name_cached = st.session_state.get("last_ref_name")
-        catchment_radius_cached = st.session_state.get("last_catchment_radius", 50)
+    elif _load_frame("last_results") is not None:
+        df_res = _load_frame("last_results")
+        airports_df = _load_frame("last_airports")
+        seaports_df = _load_frame("last_seaports")
+        ss = dict(st.session_state)
+        ref_name_cached = ss.get("last_ref_name")
+        catchment_radius_cached = ss.get("last_catchment_radius", 50)
         
         st.subheader("📊 Results (Previous Run)")
         st.dataframe(df_res, use_container_width=True)
@@ -1778,17 +2770,12 @@ def main():
             display_catchment_summary(df_res, catchment_radius_cached)
         
         with st.expander("📋 Processing Log"):
-            for rec in st.session_state.get("last_logs", []):
-                st.write(f"**{rec['site']}**")
-                for step in rec.get("steps", []):
-                    if "msg" in step:
-                        st.write(f"- {step['msg']}")
-                    if "error" in step:
-                        st.error(f"- {step['error']}")
+            st.markdown(_log_markdown(ss.get("last_logs", [])))
         
         if st.checkbox("🗺️ Show Interactive Map", key="show_map"):
             if airports_df is not None and seaports_df is not None:
-                maybe_map(df_res, airports_df, seaports_df)
+                maybe_map(df_res, airports_df, seaports_df,
+                          ss.get("ref_lat"), ss.get("ref_lon"), ss.get("ref_name"))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file